@@ -18,7 +18,8 @@ from app.core.auth import (
     reset_user_password,
     create_email_verification_token,
     verify_email_code,
-    resend_verification_email
+    resend_verification_email,
+    invalidate_cached_user
 )
 from app.core.email_service import email_service
 from app.core.database import get_database
@@ -129,6 +130,7 @@ async def verify_email(verification_data: EmailVerificationVerify):
             {"_id": user.id},
             {"$set": {"last_login": datetime.utcnow()}}
         )
+        invalidate_cached_user(user.email)
         user.last_login = datetime.utcnow()
         
         # Create access token
@@ -238,6 +240,7 @@ async def login(user_credentials: UserLogin):
             {"_id": user.id},
             {"$set": {"last_login": datetime.utcnow()}}
         )
+        invalidate_cached_user(user.email)
         user.last_login = datetime.utcnow()
         
         # Create access token
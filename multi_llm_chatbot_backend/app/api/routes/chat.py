@@ -1,47 +1,151 @@
 from fastapi import APIRouter, Request, HTTPException, Body, Depends
+from fastapi.responses import StreamingResponse
 from app.models.persona import Persona
 from app.core.session_manager import get_session_manager
-from app.api.utils import get_or_create_session_for_request_async
+from app.api.utils import (
+    get_or_create_session_for_request_async, get_or_load_chat_session, fetch_chat_session,
+    invalidate_chat_session_cache, to_memory_session_id, ORJSONResponse
+)
 from app.core.bootstrap import chat_orchestrator
 from app.core.auth import get_current_active_user
 from app.models.user import User
-from pydantic import BaseModel
-from typing import Optional
+from pydantic import AfterValidator, BaseModel, ConfigDict, Field
+from typing import Annotated, Optional
+import asyncio
+import json
 import logging
-from app.core.database import get_database
+import unicodedata
 from bson import ObjectId
 
 logger = logging.getLogger(__name__)
 
-router = APIRouter()
+# Responses are encoded with orjson; these endpoints return long message lists
+router = APIRouter(default_response_class=ORJSONResponse)
 session_manager = get_session_manager()
 
+# Prefix added to a reply so the advisor knows which of its messages is being answered
+REPLY_CONTEXT_TEMPLATE = "[Replying to your previous message: '{snippet}...'] {user_input}"
+
+def _truncate(text: str, limit: int = 100) -> str:
+    """Cut text to at most `limit` characters without splitting off combining marks"""
+    if len(text) <= limit:
+        return text
+    end = limit
+    while end > 0 and unicodedata.combining(text[end]):
+        end -= 1
+    return text[:end]
+
 # Enhanced data models
-class UserInput(BaseModel):
+def _validate_chat_session_id(value: str) -> str:
+    """Reject chat session ids that are not ObjectIds while the body is parsed"""
+    if not ObjectId.is_valid(value):
+        raise ValueError("Invalid chat_session_id")
+    return value
+
+ChatSessionId = Annotated[str, AfterValidator(_validate_chat_session_id)]
+
+class ChatRequestModel(BaseModel):
+    """Base for the request bodies below: unknown fields are dropped and nothing is re-validated after parsing"""
+    model_config = ConfigDict(
+        extra="ignore",
+        validate_assignment=False,
+        str_strip_whitespace=False
+    )
+
+class UserInput(ChatRequestModel):
     user_input: str
 
-class ChatMessage(BaseModel):
+class ChatMessage(ChatRequestModel):
     user_input: str
     session_id: Optional[str] = None
-    chat_session_id: Optional[str] = None  # MongoDB chat session ID
+    chat_session_id: Optional[ChatSessionId] = None  # MongoDB chat session ID
     response_length: str = "medium"
 
-class ReplyToAdvisor(BaseModel):
+class ReplyToAdvisor(ChatRequestModel):
     user_input: str
     advisor_id: str
-    original_message_id: str = None
-    chat_session_id: Optional[str] = None
+    original_message_id: Optional[str] = None
+    chat_session_id: Optional[ChatSessionId] = None
 
-class PersonaQuery(BaseModel):
+class PersonaQuery(ChatRequestModel):
     question: str
     persona: str
 
-class SwitchChatRequest(BaseModel):
-    chat_session_id: str
+class SwitchChatRequest(ChatRequestModel):
+    chat_session_id: ChatSessionId
+    # Return only the most recent messages; None returns the whole history
+    message_limit: Optional[int] = Field(default=None, ge=1)
 
-class NewChatRequest(BaseModel):
+class NewChatRequest(ChatRequestModel):
     title: Optional[str] = "New Chat"
 
+def _normalize_persona_result(persona_id: str, persona_result) -> dict:
+    """Convert a chat_with_persona result (a PersonaResponse) into the response entry sent to the frontend"""
+    if not isinstance(persona_result, dict) or "kind" not in persona_result:
+        # Fallback for anything that isn't a PersonaResponse
+        return {
+            "persona_id": persona_id,
+            "persona_name": chat_orchestrator.persona_names.get(persona_id, "Unknown"),
+            "content": "I'm having trouble processing your question right now. Please try again.",
+            "used_documents": False,
+            "document_chunks_used": 0
+        }
+    
+    return {
+        "persona_id": persona_result["persona_id"],
+        "persona_name": persona_result["persona_name"],
+        "content": persona_result["response"],
+        "used_documents": persona_result["used_documents"],
+        "document_chunks_used": persona_result["document_chunks_used"]
+    }
+
+def _persona_response_entry(persona_id: str, persona_result) -> dict:
+    """Response entry for one persona in /chat-sequential, with a fallback if its call failed"""
+    try:
+        # Exceptions from the concurrent calls are returned, not raised
+        if isinstance(persona_result, Exception):
+            raise persona_result
+        
+        return _normalize_persona_result(persona_id, persona_result)
+        
+    except Exception as e:
+        logger.error("Error generating response for persona %s: %s", persona_id, e)
+        return {
+            "persona_id": persona_id,
+            "persona_name": chat_orchestrator.persona_names.get(persona_id, "Unknown"),
+            "content": "I encountered an error while processing your question. Please try again.",
+            "used_documents": False,
+            "document_chunks_used": 0
+        }
+
+def _encode_stream_event(event: dict, event_stream: bool) -> str:
+    """Frame a stream event as an NDJSON line or, for EventSource clients, an SSE event"""
+    data = json.dumps(event)
+    if event_stream:
+        return f"event: {event['type']}\ndata: {data}\n\n"
+    return data + "\n"
+
+async def _stream_persona_responses(persona_ids, user_input: str, session_id: str,
+                                    response_length: str, session_debug: dict, event_stream: bool = False):
+    """
+    Yield one event per persona reply in completion order, followed by a final
+    "done" event carrying the session debug info. Events are NDJSON lines, or
+    server-sent events when event_stream is set.
+    """
+    valid_responses = 0
+    async for persona_id, persona_result in chat_orchestrator.stream_personas_batch(
+        persona_ids=persona_ids,
+        user_input=user_input,
+        session_id=session_id,
+        response_length=response_length
+    ):
+        entry = _persona_response_entry(persona_id, persona_result)
+        valid_responses += 1
+        yield _encode_stream_event({"type": "persona_response", "response": entry}, event_stream)
+    
+    session_debug["valid_responses"] = valid_responses
+    yield _encode_stream_event({"type": "done", "session_debug": session_debug}, event_stream)
+
 @router.post("/switch-chat")
 async def switch_to_chat(
     request: SwitchChatRequest, 
@@ -53,72 +157,72 @@ async def switch_to_chat(
     Ensures documents are accessible after switching
     """
     try:
-        logger.info(f"Switching to chat session: {request.chat_session_id}")
-        
-        # Load the chat session into memory context with consistent session ID
-        memory_session_id = await get_or_create_session_for_request_async(
-            req, 
-            chat_session_id=request.chat_session_id,
-            user_id=str(current_user.id)
+        logger.info("Switching to chat session: %s", request.chat_session_id)
+        
+        # Load the chat session into memory context (with consistent session ID) while
+        # fetching the stored messages in the original frontend format from MongoDB
+        memory_session_id, chat_session = await asyncio.gather(
+            get_or_create_session_for_request_async(
+                req, 
+                chat_session_id=request.chat_session_id,
+                user_id=str(current_user.id)
+            ),
+            fetch_chat_session(request.chat_session_id, str(current_user.id), request.message_limit)
         )
         
         if not memory_session_id:
             raise HTTPException(status_code=404, detail="Chat session not found")
         
-        logger.info(f"Loaded chat into memory session: {memory_session_id}")
+        if not chat_session:
+            raise HTTPException(status_code=404, detail="Chat session not found in database")
+        
+        logger.info("Loaded chat into memory session: %s", memory_session_id)
         
         # Get the loaded session
         session = session_manager.get_session(memory_session_id)
         
         # Verify document access after loading
         rag_stats = session.get_rag_stats()
-        logger.info(f"After switch - Session {memory_session_id} has {rag_stats.get('total_documents', 0)} documents")
-        
-        # Get the original MongoDB chat session to retrieve messages in proper format
-        db = get_database()
-        chat_session = await db.chat_sessions.find_one({
-            "_id": ObjectId(request.chat_session_id),
-            "user_id": current_user.id,
-            "is_active": True
-        })
-        
-        if not chat_session:
-            raise HTTPException(status_code=404, detail="Chat session not found in database")
+        total_documents = rag_stats.get('total_documents', 0)
+        logger.info("After switch - Session %s has %d documents", memory_session_id, total_documents)
         
         # Return the messages in the original frontend format from MongoDB
         original_messages = chat_session.get("messages", [])
+        total_message_count = chat_session.get("total_message_count", len(original_messages))
         
-        logger.info(f"Switch successful - {len(original_messages)} messages, {rag_stats.get('total_documents', 0)} documents")
+        logger.info("Switch successful - %d messages, %d documents", len(original_messages), total_documents)
         
-        return {
+        # Returned as a response object so the (possibly long) message list is encoded
+        # once by orjson rather than walked by jsonable_encoder first
+        return ORJSONResponse({
             "status": "success",
             "memory_session_id": memory_session_id,
             "chat_session_id": request.chat_session_id,
             "message_count": len(original_messages),
+            "total_message_count": total_message_count,
             "context": {
                 "messages": original_messages,  # Return original format messages
                 "rag_info": rag_stats
             },
             # Include document access verification
             "document_access": {
-                "total_documents": rag_stats.get('total_documents', 0),
+                "total_documents": total_documents,
                 "total_chunks": rag_stats.get('total_chunks', 0),
                 "documents": rag_stats.get('documents', []),
                 "uploaded_files": session.uploaded_files
             },
             "debug_info": {
                 "memory_session_format": memory_session_id,
-                "documents_accessible": rag_stats.get('total_documents', 0) > 0,
-                "session_loaded": memory_session_id in session_manager.sessions
+                "documents_accessible": total_documents > 0,
+                "session_loaded": session_manager.contains(memory_session_id)
             }
-        }
+        })
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error switching to chat {request.chat_session_id}: {e}")
-        import traceback
-        logger.error(f"Full traceback: {traceback.format_exc()}")
+        logger.error("Error switching to chat %s: %s", request.chat_session_id, e)
+        logger.error("Full traceback", exc_info=True)
         raise HTTPException(status_code=500, detail="Failed to switch to chat")
 
 @router.post("/new-chat")
@@ -149,7 +253,7 @@ async def create_new_chat(
         }
         
     except Exception as e:
-        logger.error(f"Error creating new chat: {e}")
+        logger.error("Error creating new chat: %s", e)
         raise HTTPException(status_code=500, detail="Failed to create new chat")
 
 @router.post("/chat-sequential")
@@ -164,35 +268,26 @@ async def chat_sequential_enhanced(
     try:
         # Ensure consistent session ID for document retrieval
         if message.chat_session_id:
-            # Use the memory session format that matches document storage
-            session_id = f"chat_{message.chat_session_id}"
-            logger.info(f"Using chat session: {session_id}")
+            # New messages are about to be saved to this chat
+            invalidate_chat_session_cache(message.chat_session_id)
             
-            # FIXED: Ensure session exists in memory (load if needed)
-            if session_id not in session_manager.sessions:
-                logger.warning(f"Chat session {message.chat_session_id} not in memory, loading now")
-                
-                # FIXED: Pass the user_id parameter to properly load existing session
-                loaded_session_id = await get_or_create_session_for_request_async(
-                    request, 
-                    chat_session_id=message.chat_session_id,
-                    user_id=str(current_user.id)
-                )
-                
-                # Use the loaded session ID
-                session_id = loaded_session_id
-                logger.info(f"Loaded session from database: {session_id}")
+            # Use the memory session that matches document storage, loading it if needed
+            session, session_id, was_loaded = await get_or_load_chat_session(
+                request, message.chat_session_id, str(current_user.id)
+            )
+            if was_loaded:
+                logger.info("Loaded session from database: %s", session_id)
+            else:
+                logger.info("Using chat session: %s", session_id)
         else:
             # No specific chat session, create/use ephemeral session
             session_id = await get_or_create_session_for_request_async(request)
-            logger.info(f"Using ephemeral session: {session_id}")
-
-        # Get session from memory
-        session = session_manager.get_session(session_id)
+            logger.info("Using ephemeral session: %s", session_id)
+            session = session_manager.get_session(session_id)
         
         # Log session debugging info
         rag_stats = session.get_rag_stats()
-        logger.info(f"Session {session_id} has {rag_stats.get('total_documents', 0)} documents available")
+        logger.info("Session %s has %d documents available", session_id, rag_stats.get('total_documents', 0))
         
         # Add user message to session (needed for persona ranking)
         session.append_message("user", message.user_input)
@@ -203,99 +298,55 @@ async def chat_sequential_enhanced(
             k=3  # Limit to top 3 most relevant personas
         )
         
-        logger.info(f"Intelligent persona order for session {session_id}: {top_personas}")
-        
-        # Generate responses from ONLY the top personas
-        responses = []
-        
-        for persona_id in top_personas:
-            try:
-                logger.info(f"Generating response for {persona_id} with session {session_id}")
-                
-                # Generate response from this specific persona
-                persona_result = await chat_orchestrator.chat_with_persona(
-                    user_input=message.user_input,
-                    persona_id=persona_id,
-                    session_id=session_id,  # This ensures document access
-                    response_length=message.response_length or "medium"
-                )
-                
-                # FIXED: Safe response processing with proper error handling
-                if isinstance(persona_result, dict):
-                    # Handle different response formats
-                    if "persona_name" in persona_result and "response" in persona_result:
-                        responses.append({
-                            "persona_id": persona_result["persona_id"],
-                            "persona_name": persona_result["persona_name"], 
-                            "content": persona_result["response"],
-                            "used_documents": persona_result.get("used_documents", False),
-                            "document_chunks_used": persona_result.get("document_chunks_used", 0)
-                        })
-                    elif persona_result.get("type") == "single_persona_response" and "persona" in persona_result:
-                        persona_data = persona_result["persona"]
-                        responses.append({
-                            "persona_id": persona_data["persona_id"],
-                            "persona_name": persona_data["persona_name"],
-                            "content": persona_data["response"],
-                            "used_documents": persona_data.get("used_documents", False),
-                            "document_chunks_used": persona_data.get("document_chunks_used", 0)
-                        })
-                    elif "error" in persona_result:
-                        # Handle error responses
-                        responses.append({
-                            "persona_id": persona_id,
-                            "persona_name": chat_orchestrator.personas[persona_id].name,
-                            "content": persona_result["response"],
-                            "used_documents": False,
-                            "document_chunks_used": 0
-                        })
-                    else:
-                        # Generic dict response
-                        content = persona_result.get("response") or persona_result.get("content", "")
-                        if content.strip():
-                            responses.append({
-                                "persona_id": persona_id,
-                                "persona_name": chat_orchestrator.personas[persona_id].name,
-                                "content": content,
-                                "used_documents": persona_result.get("used_documents", False),
-                                "document_chunks_used": persona_result.get("document_chunks_used", 0)
-                            })
-                else:
-                    # Fallback for non-dict responses
-                    responses.append({
-                        "persona_id": persona_id,
-                        "persona_name": chat_orchestrator.personas[persona_id].name,
-                        "content": "I'm having trouble processing your question right now. Please try again.",
-                        "used_documents": False,
-                        "document_chunks_used": 0
-                    })
-                    
-            except Exception as e:
-                logger.error(f"Error generating response for persona {persona_id}: {str(e)}")
-                responses.append({
-                    "persona_id": persona_id,
-                    "persona_name": chat_orchestrator.personas[persona_id].name,
-                    "content": "I encountered an error while processing your question. Please try again.",
-                    "used_documents": False,
-                    "document_chunks_used": 0
-                })
+        logger.info("Intelligent persona order for session %s: %s", session_id, top_personas)
         
-        return {
-            "responses": responses,
-            "session_debug": {
-                "session_id": session_id,
-                "documents_available": rag_stats.get('total_documents', 0),
-                "chunks_available": rag_stats.get('total_chunks', 0),
-                "valid_responses": len(responses),
-                "selected_personas": top_personas,
-                "total_personas_available": len(chat_orchestrator.personas)
-            }
+        session_debug = {
+            "session_id": session_id,
+            "documents_available": rag_stats.get('total_documents', 0),
+            "chunks_available": rag_stats.get('total_chunks', 0),
+            "selected_personas": top_personas,
+            "total_personas_available": len(chat_orchestrator.personas)
         }
         
+        # Clients that accept NDJSON or server-sent events get each persona's reply
+        # as soon as it is ready
+        accept = request.headers.get("accept", "")
+        event_stream = "text/event-stream" in accept
+        if event_stream or "application/x-ndjson" in accept:
+            return StreamingResponse(
+                _stream_persona_responses(
+                    top_personas, message.user_input, session_id,
+                    message.response_length or "medium", session_debug, event_stream
+                ),
+                media_type="text/event-stream" if event_stream else "application/x-ndjson",
+                headers={"Cache-Control": "no-cache"}
+            )
+        
+        # Generate responses from ONLY the top personas concurrently in a single orchestrator call
+        persona_results = await chat_orchestrator.chat_with_personas_batch(
+            persona_ids=top_personas,
+            user_input=message.user_input,
+            session_id=session_id,  # This ensures document access
+            response_length=message.response_length or "medium"
+        )
+        
+        responses = [
+            _persona_response_entry(persona_id, persona_result)
+            for persona_id, persona_result in zip(top_personas, persona_results)
+        ]
+        
+        session_debug["valid_responses"] = len(responses)
+        # Encoded by orjson directly, skipping jsonable_encoder's walk of the reply texts
+        return ORJSONResponse({
+            "responses": responses,
+            "session_debug": session_debug
+        })
+        
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error in chat_sequential_enhanced: {e}")
-        import traceback
-        logger.error(f"Full traceback: {traceback.format_exc()}")
+        logger.error("Error in chat_sequential_enhanced: %s", e)
+        logger.error("Full traceback", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Chat processing failed: {str(e)}")
 
 
@@ -316,29 +367,17 @@ async def chat_with_specific_advisor(persona_id: str, input: UserInput, request:
         )
         
         # Handle response structure
-        if result.get("type") == "single_persona_response" and "persona" in result:
-            persona_data = result["persona"]
-            return {
-                "persona": persona_data["persona_name"],
-                "persona_id": persona_data["persona_id"],
-                "response": persona_data["response"]
-            }
-        elif "persona_id" in result and "response" in result:
-            return {
-                "persona": result["persona_name"],
-                "persona_id": result["persona_id"],
-                "response": result["response"]
-            }
-        else:
-            return {
-                "persona": "System",
-                "response": "I'm having trouble generating a response right now. Please try again."
-            }
+        normalized = _normalize_persona_result(persona_id, result)
+        return {
+            "persona": normalized["persona_name"],
+            "persona_id": normalized["persona_id"],
+            "response": normalized["content"]
+        }
             
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in chat_with_specific_advisor: {e}")
+        logger.error("Error in chat_with_specific_advisor: %s", e)
         return {
             "persona": "System",
             "response": "I'm having trouble generating a response right now. Please try again."
@@ -353,7 +392,9 @@ async def reply_to_advisor(reply: ReplyToAdvisor, request: Request):
 
         # Handle session management for existing chats
         if reply.chat_session_id:
-            session_id = f"chat_{reply.chat_session_id}"
+            session_id = to_memory_session_id(reply.chat_session_id)
+            # New messages are about to be saved to this chat
+            invalidate_chat_session_cache(reply.chat_session_id)
         else:
             session_id = await get_or_create_session_for_request_async(request)
         
@@ -362,15 +403,17 @@ async def reply_to_advisor(reply: ReplyToAdvisor, request: Request):
         # Find the original message being replied to for context
         original_message = None
         if reply.original_message_id:
-            for msg in session.messages:
-                if getattr(msg, 'id', None) == reply.original_message_id:
-                    original_message = msg.content
-                    break
+            msg = session.messages_by_id.get(reply.original_message_id)
+            if msg:
+                original_message = msg["content"]
         
         # Create context-aware input
         contextual_input = reply.user_input
         if original_message:
-            contextual_input = f"[Replying to your previous message: '{original_message[:100]}...'] {reply.user_input}"
+            contextual_input = REPLY_CONTEXT_TEMPLATE.format(
+                snippet=_truncate(str(original_message)),
+                user_input=reply.user_input
+            )
         
         result = await chat_orchestrator.chat_with_persona(
             user_input=contextual_input,
@@ -379,34 +422,19 @@ async def reply_to_advisor(reply: ReplyToAdvisor, request: Request):
         )
         
         # Handle response structure
-        if result.get("type") == "single_persona_response" and "persona" in result:
-            persona_data = result["persona"]
-            return {
-                "type": "advisor_reply",
-                "persona": persona_data["persona_name"],
-                "persona_id": persona_data["persona_id"],
-                "response": persona_data["response"],
-                "original_message_id": reply.original_message_id
-            }
-        elif "persona_id" in result and "response" in result:
-            return {
-                "type": "advisor_reply",
-                "persona": result["persona_name"],
-                "persona_id": result["persona_id"],
-                "response": result["response"],
-                "original_message_id": reply.original_message_id
-            }
-        else:
-            return {
-                "type": "error",
-                "persona": "System",
-                "response": "I'm having trouble generating a reply right now. Please try again."
-            }
+        normalized = _normalize_persona_result(reply.advisor_id, result)
+        return {
+            "type": "advisor_reply",
+            "persona": normalized["persona_name"],
+            "persona_id": normalized["persona_id"],
+            "response": normalized["content"],
+            "original_message_id": reply.original_message_id
+        }
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error in reply_to_advisor: {e}")
+        logger.error("Error in reply_to_advisor: %s", e)
         return {
             "type": "error",
             "persona": "System",
@@ -425,13 +453,8 @@ async def ask_question(query: PersonaQuery, request: Request):
             session_id=session_id
         )
         
-        if result["type"] == "single_persona_response":
-            response_text = result["persona"]["response"]
-        else:
-            response_text = result.get("message", "I'm having trouble responding right now.")
-        
-        return {"response": response_text}
+        return {"response": _normalize_persona_result(query.persona, result)["content"]}
         
     except Exception as e:
-        logger.error(f"Error in ask endpoint: {str(e)}")
+        logger.error("Error in ask endpoint: %s", e)
         return {"response": "I encountered an error. Please try again."}
\ No newline at end of file
@@ -1,16 +1,20 @@
-from fastapi import APIRouter, HTTPException, Depends, status
+from fastapi import APIRouter, HTTPException, Depends, Query, status
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timezone
 from bson import ObjectId
+from cachetools import TTLCache
 from app.models.user import User, ChatSession, ChatSessionResponse
 from app.core.auth import get_current_active_user
 from app.core.database import get_database
+from app.api.utils import ORJSONResponse, invalidate_chat_session_cache, to_memory_session_id, to_object_id
+from app.core.session_manager import get_session_manager
 from pydantic import BaseModel
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
+session_manager = get_session_manager()
 
 class CreateChatSessionRequest(BaseModel):
     title: str
@@ -23,6 +27,35 @@ class SaveMessageRequest(BaseModel):
     session_id: str
     message: dict
 
+def _utcnow() -> datetime:
+    """Current UTC time as a naive datetime, matching the timestamps already stored"""
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+# Chat sessions recently confirmed to be active and owned by a user, keyed by
+# (user_id, session_id), so saving each message of a turn doesn't repeat the check.
+# Deleting a chat drops its entry.
+_owned_sessions = TTLCache(maxsize=10_000, ttl=30)
+
+async def _verify_session_owner(user_id, session_id: str) -> bool:
+    """Check that a chat session is active and belongs to the user"""
+    key = (str(user_id), session_id)
+    if key in _owned_sessions:
+        return True
+    
+    db = get_database()
+    session_data = await db.chat_sessions.find_one(
+        {
+            "_id": to_object_id(session_id),
+            "user_id": user_id,
+            "is_active": True
+        },
+        projection={"_id": 1}
+    )
+    if session_data is None:
+        return False
+    _owned_sessions[key] = True
+    return True
+
 @router.post("/chat-sessions", response_model=dict)
 async def create_chat_session(
     request: CreateChatSessionRequest,
@@ -32,16 +65,19 @@ async def create_chat_session(
     try:
         db = get_database()
         
+        now = _utcnow()
         session = ChatSession(
             user_id=current_user.id,
             title=request.title,
             messages=[],
-            created_at=datetime.utcnow(),
-            updated_at=datetime.utcnow()
+            created_at=now,
+            updated_at=now
         )
         
         result = await db.chat_sessions.insert_one(session.dict(by_alias=True))
         session.id = result.inserted_id
+        # The first messages are saved right after the chat is created
+        _owned_sessions[(str(current_user.id), str(session.id))] = True
         
         return {
             "id": str(session.id),
@@ -68,21 +104,33 @@ async def get_user_chat_sessions(
     try:
         db = get_database()
         
-        cursor = db.chat_sessions.find(
-            {"user_id": current_user.id, "is_active": True}
-        ).sort("updated_at", -1).skip(skip).limit(limit)
-        
-        sessions = []
-        async for session_data in cursor:
-            sessions.append(ChatSessionResponse(
+        # Count messages in the database instead of transferring every message list
+        cursor = db.chat_sessions.aggregate([
+            {"$match": {"user_id": current_user.id, "is_active": True}},
+            {"$sort": {"updated_at": -1}},
+            {"$skip": skip},
+            {"$limit": limit},
+            {"$project": {
+                "title": 1,
+                "created_at": 1,
+                "updated_at": 1,
+                "message_count": {"$size": {"$ifNull": ["$messages", []]}}
+            }}
+        ])
+        
+        # Materialize the page in one call rather than iterating the cursor per document
+        sessions_data = await cursor.to_list(length=limit)
+        
+        return [
+            ChatSessionResponse(
                 id=str(session_data["_id"]),
                 title=session_data["title"],
                 created_at=session_data["created_at"],
                 updated_at=session_data["updated_at"],
-                message_count=len(session_data.get("messages", []))
-            ))
-        
-        return sessions
+                message_count=session_data["message_count"]
+            )
+            for session_data in sessions_data
+        ]
         
     except Exception as e:
         logger.error(f"Error fetching chat sessions: {e}")
@@ -122,17 +170,30 @@ async def get_chat_sessions_count(
 @router.get("/chat-sessions/{session_id}")
 async def get_chat_session(
     session_id: str,
+    # Return only the most recent messages; None returns the whole history
+    limit: Optional[int] = Query(default=None, ge=1),
     current_user: User = Depends(get_current_active_user)
 ):
-    """Get a specific chat session with all messages"""
+    """Get a specific chat session with its messages (the last `limit` if given)"""
     try:
+        oid = to_object_id(session_id)
         db = get_database()
         
+        projection = None
+        if limit:
+            projection = {
+                "title": 1,
+                "created_at": 1,
+                "updated_at": 1,
+                "messages": {"$slice": -limit},
+                "total_message_count": {"$size": {"$ifNull": ["$messages", []]}}
+            }
+        
         session_data = await db.chat_sessions.find_one({
-            "_id": ObjectId(session_id),
+            "_id": oid,
             "user_id": current_user.id,
             "is_active": True
-        })
+        }, projection=projection)
         
         if not session_data:
             raise HTTPException(
@@ -140,13 +201,17 @@ async def get_chat_session(
                 detail="Chat session not found"
             )
         
-        return {
+        messages = session_data.get("messages", [])
+        # Returned as a response object so the message list is encoded once by orjson
+        # rather than walked by jsonable_encoder first
+        return ORJSONResponse({
             "id": str(session_data["_id"]),
             "title": session_data["title"],
-            "messages": session_data.get("messages", []),
+            "messages": messages,
+            "total_message_count": session_data.get("total_message_count", len(messages)),
             "created_at": session_data["created_at"],
             "updated_at": session_data["updated_at"]
-        }
+        })
         
     except HTTPException:
         raise
@@ -165,22 +230,10 @@ async def update_chat_session(
 ):
     """Update a chat session (title or messages)"""
     try:
+        oid = to_object_id(session_id)
         db = get_database()
         
-        # Verify session belongs to user
-        session_data = await db.chat_sessions.find_one({
-            "_id": ObjectId(session_id),
-            "user_id": current_user.id,
-            "is_active": True
-        })
-        
-        if not session_data:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Chat session not found"
-            )
-        
-        update_data = {"updated_at": datetime.utcnow()}
+        update_data = {"updated_at": _utcnow()}
         
         if request.title is not None:
             update_data["title"] = request.title
@@ -188,10 +241,23 @@ async def update_chat_session(
         if request.messages is not None:
             update_data["messages"] = request.messages
         
-        await db.chat_sessions.update_one(
-            {"_id": ObjectId(session_id)},
+        # The filter doubles as the ownership check, so this is a single round-trip
+        result = await db.chat_sessions.update_one(
+            {
+                "_id": oid,
+                "user_id": current_user.id,
+                "is_active": True
+            },
             {"$set": update_data}
         )
+        invalidate_chat_session_cache(session_id)
+        
+        if result.matched_count == 0:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Chat session not found"
+            )
+        _owned_sessions[(str(current_user.id), session_id)] = True
         
         return {"message": "Chat session updated successfully"}
         
@@ -212,16 +278,8 @@ async def save_message_to_session(
 ):
     """Add a message to a chat session"""
     try:
-        db = get_database()
-        
         # Verify session belongs to user
-        session_data = await db.chat_sessions.find_one({
-            "_id": ObjectId(session_id),
-            "user_id": current_user.id,
-            "is_active": True
-        })
-        
-        if not session_data:
+        if not await _verify_session_owner(current_user.id, session_id):
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Chat session not found"
@@ -230,15 +288,24 @@ async def save_message_to_session(
         # Add timestamp to message if not present
         message = request.message.copy()
         if "timestamp" not in message:
-            message["timestamp"] = datetime.utcnow().isoformat()
+            message["timestamp"] = _utcnow().isoformat()
         
+        db = get_database()
         await db.chat_sessions.update_one(
-            {"_id": ObjectId(session_id)},
+            {"_id": to_object_id(session_id)},
             {
                 "$push": {"messages": message},
-                "$set": {"updated_at": datetime.utcnow()}
+                "$set": {"updated_at": _utcnow()}
             }
         )
+        invalidate_chat_session_cache(session_id)
+        
+        # If the chat is loaded in memory, index the message under its frontend id
+        # so /reply-to-advisor can find it without reloading the chat
+        memory_session = session_manager.peek_session(to_memory_session_id(session_id))
+        if memory_session is not None and isinstance(message.get("content"), str):
+            role = "user" if message.get("type") == "user" else message.get("persona_id")
+            memory_session.attach_message_id(message.get("id"), message["content"], role)
         
         return {"message": "Message saved successfully"}
         
@@ -260,15 +327,18 @@ async def delete_chat_session(
 ):
     """Delete a chat session (soft delete)"""
     try:
+        oid = to_object_id(session_id)
         db = get_database()
         
         result = await db.chat_sessions.update_one(
             {
-                "_id": ObjectId(session_id),
+                "_id": oid,
                 "user_id": current_user.id
             },
-            {"$set": {"is_active": False, "updated_at": datetime.utcnow()}}
+            {"$set": {"is_active": False, "updated_at": _utcnow()}}
         )
+        invalidate_chat_session_cache(session_id)
+        _owned_sessions.pop((str(current_user.id), session_id), None)
         
         if result.matched_count == 0:
             raise HTTPException(
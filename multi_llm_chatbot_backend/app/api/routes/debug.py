@@ -2,6 +2,8 @@ from fastapi import APIRouter, Request, Query
 from app.core.session_manager import get_session_manager
 from app.core.rag_manager import get_rag_manager
 from app.core.bootstrap import chat_orchestrator
+from app.api.utils import ORJSONResponse
+from cachetools import TTLCache
 import logging
 
 from app.api.old_routes import get_or_create_session_for_request
@@ -12,19 +14,25 @@ router = APIRouter()
 
 session_manager = get_session_manager()
 
+# Recent /debug/rag-status results per session, so a polling dashboard doesn't
+# rerun the test search against the vector store on every hit. Each entry is stored
+# with the session's RAG stats memo it was built from; an upload or reset replaces
+# that memo, which makes the entry stale at once.
+_rag_status_cache = TTLCache(maxsize=256, ttl=30)
+
 @router.get("/debug/personas")
 async def debug_personas(request: Request):
     try:
         session_id = get_or_create_session_for_request(request)
         session = session_manager.get_session(session_id)
-        rag_manager = get_rag_manager()
-        rag_stats = rag_manager.get_document_stats(session_id)
+        rag_stats = session.get_rag_stats()
 
-        return {
+        # Response objects are encoded by orjson directly, skipping jsonable_encoder
+        return ORJSONResponse({
             "personas": {
                 pid: {
                     "name": persona.name,
-                    "prompt": persona.system_prompt[:100] + "...",
+                    "prompt": persona.prompt_preview,
                     "retrieval_keywords": chat_orchestrator._get_persona_context_keywords(pid)
                 } for pid, persona in chat_orchestrator.personas.items()
             },
@@ -33,7 +41,7 @@ async def debug_personas(request: Request):
                 "uploaded_files": session.uploaded_files,
                 "rag_stats": rag_stats
             }
-        }
+        })
     except Exception as e:
         logger.error(f"Error in debug endpoint: {str(e)}")
         return {
@@ -63,21 +71,29 @@ async def get_ranked_personas(request: Request, k: int = Query(3, ge=1, le=10)):
 async def debug_rag_status(request: Request):
     try:
         session_id = get_or_create_session_for_request(request)
+        rag_stats = session_manager.get_session(session_id).get_rag_stats()
+        cached = _rag_status_cache.get(session_id)
+        if cached is not None and cached[0] is rag_stats:
+            return ORJSONResponse(cached[1])
+        
         rag_manager = get_rag_manager()
-        session_stats = session_manager.get_session_stats(session_id)
 
-        test_search = rag_manager.search_documents(
-            query="test methodology research",
-            session_id=session_id,
-            persona_context="",
-            n_results=3
-        )
+        # A session with no indexed chunks can't match anything, so skip the embed + search
+        test_search = []
+        if rag_stats.get("total_chunks", 0) > 0:
+            test_search = await rag_manager.asearch_documents_with_context(
+                query="test methodology research",
+                session_id=session_id,
+                persona_context="",
+                n_results=3
+            )
 
-        return {
+        rag_status = {
             "rag_manager_healthy": True,
             "session_id": session_id,
-            "session_stats": session_stats.get("rag_stats", {}),
+            "session_stats": rag_stats,
             "test_search_results": len(test_search),
+            # The search already returns at most n_results chunks, so no slice is needed
             "test_search_details": [
                 {
                     "relevance": chunk.get("relevance_score", 0),
@@ -85,13 +101,15 @@ async def debug_rag_status(request: Request):
                     "text_length": len(chunk.get("text", "")),
                     "filename": chunk.get("metadata", {}).get("filename", "unknown")
                 }
-                for chunk in test_search[:3]
+                for chunk in test_search
             ],
             "persona_keywords": {
                 pid: chat_orchestrator._get_persona_context_keywords(pid)
                 for pid in chat_orchestrator.personas.keys()
             }
         }
+        _rag_status_cache[session_id] = (rag_stats, rag_status)
+        return ORJSONResponse(rag_status)
 
     except Exception as e:
         logger.error(f"Error in RAG debug: {str(e)}")
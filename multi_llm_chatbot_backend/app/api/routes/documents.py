@@ -1,19 +1,21 @@
 from fastapi import APIRouter, Request, HTTPException, UploadFile, File, Body, Depends
 from fastapi import Query
+from typing import List, Literal, Optional, Tuple
 from app.utils.document_extractor import extract_text_from_file
 from app.core.session_manager import get_session_manager
 from app.core.rag_manager import get_rag_manager
-from app.api.utils import get_or_create_session_for_request_async
-from fastapi.responses import StreamingResponse
+from app.api.utils import CHAT_SESSION_PROJECTION, ORJSONResponse, fetch_chat_sessions_bulk, get_or_create_session_for_request_async, to_memory_session_id, to_object_id
 from app.utils.chat_summary import generate_summary_from_messages, parse_summary_to_blocks, format_summary_for_text_export
-from app.utils.file_export import prepare_export_response, generate_pdf_file_from_blocks
+from app.utils.file_export import prepare_export_response, generate_pdf_file_from_blocks, stream_export_file
 from app.core.session_manager import get_session_manager
 from app.core.bootstrap import chat_orchestrator
 from app.core.auth import get_current_active_user
 from app.core.database import get_database
 from app.models.user import User
-from bson import ObjectId
+import asyncio
 import logging
+import os
+from contextlib import asynccontextmanager
 import re
 from html import unescape
 
@@ -25,6 +27,37 @@ router = APIRouter()
 session_manager = get_session_manager()
 get_rag_manager = get_rag_manager
 
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
+
+FILE_TYPE_MAP = {
+    "application/pdf": "pdf",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx", 
+    "text/plain": "txt"
+}
+
+# Export formats accepted by the export and summary endpoints
+ExportFormat = Literal["txt", "pdf", "docx"]
+
+# Patterns used by sanitize_html_content on every exported message: tags, leftover
+# entities and stray angle brackets are all dropped in one pass, then whitespace collapsed
+_MARKUP_RE = re.compile(r'<[^>]*>|&[a-zA-Z0-9#]+;|[<>]')
+_WS_RE = re.compile(r'\s+')
+
+# Admission control for uploads: at most _UPLOAD_CONCURRENCY uploads are parsed and
+# indexed at once, and past _MAX_WAITING_UPLOADS queued behind them new uploads are
+# turned away with a 429 instead of piling up work (and spooled files)
+_UPLOAD_CONCURRENCY = max(2, os.cpu_count() or 1)
+_MAX_WAITING_UPLOADS = 4 * _UPLOAD_CONCURRENCY
+_upload_slots = asyncio.Semaphore(_UPLOAD_CONCURRENCY)
+_waiting_uploads = 0
+
+# Short persona keywords added to /search-documents queries when a persona filter is given
+SEARCH_PERSONA_CONTEXTS = {
+    "methodologist": "methodology research design analysis",
+    "theorist": "theory theoretical framework conceptual",
+    "pragmatist": "practical application implementation"
+}
+
 
 def sanitize_html_content(content):
     """
@@ -43,18 +76,12 @@ def sanitize_html_content(content):
         # More aggressive approach: Strip ALL HTML tags first, then apply simple formatting
         # This prevents malformed HTML from causing issues
         
-        # Remove all HTML tags completely (most aggressive approach)
-        content = re.sub(r'<[^>]*>', '', content)
+        # Remove all HTML tags, any entities unescape left behind (e.g. double-escaped
+        # ones) and stray angle brackets in a single pass
+        content = _MARKUP_RE.sub('', content)
         
         # Clean up multiple spaces and normalize whitespace
-        content = re.sub(r'\s+', ' ', content)
-        content = content.strip()
-        
-        # Remove any remaining HTML entities that might have been missed
-        content = re.sub(r'&[a-zA-Z0-9#]+;', '', content)
-        
-        # Remove any remaining angle brackets that might cause issues
-        content = content.replace('<', '').replace('>', '')
+        content = _WS_RE.sub(' ', content).strip()
         
         logger.debug(f"Sanitized content (first 200 chars): {content[:200]}")
         return content
@@ -66,7 +93,7 @@ def sanitize_html_content(content):
             import string
             allowed_chars = string.ascii_letters + string.digits + string.punctuation + ' \n\r\t'
             cleaned = ''.join(c for c in content if c in allowed_chars)
-            return re.sub(r'\s+', ' ', cleaned).strip()
+            return _WS_RE.sub(' ', cleaned).strip()
         except:
             return "Content could not be sanitized for export"
 
@@ -153,6 +180,72 @@ def convert_messages_for_export(messages):
     return converted_messages
 
 
+async def _resolve_upload_session_id(request: Request, chat_session_id: Optional[str]) -> str:
+    """Memory session that uploaded documents are added to"""
+    if chat_session_id:
+        # If uploading to a specific chat, use chat_{id} format
+        session_id = to_memory_session_id(chat_session_id)
+        logger.info(f"Uploading document to specific chat session: {session_id}")
+    else:
+        # For new/temporary chats, use regular session management
+        session_id = await get_or_create_session_for_request_async(request)
+        logger.info(f"Uploading document to new session: {session_id}")
+    return session_id
+
+
+@asynccontextmanager
+async def _upload_slot():
+    """Hold one of the upload slots for the duration of the block"""
+    global _waiting_uploads
+    if _upload_slots.locked() and _waiting_uploads >= _MAX_WAITING_UPLOADS:
+        raise HTTPException(status_code=429, detail="Too many uploads in progress. Please try again shortly.")
+    
+    _waiting_uploads += 1
+    try:
+        await _upload_slots.acquire()
+    finally:
+        _waiting_uploads -= 1
+    try:
+        yield
+    finally:
+        _upload_slots.release()
+
+
+async def _extract_upload_text(file: UploadFile) -> Tuple[str, int]:
+    """Check an upload's size and extract its text, returning (text, size in bytes)"""
+    # The upload is already spooled to a temporary file, so measure it there
+    # instead of reading the whole body into memory
+    file_size = file.size
+    if file_size is None:
+        file.file.seek(0, os.SEEK_END)
+        file_size = file.file.tell()
+    if file_size > MAX_FILE_SIZE:
+        raise HTTPException(status_code=413, detail="File size exceeds 10MB limit")
+
+    await file.seek(0)
+    # Parsing is CPU-bound; run it off the event loop
+    content = await asyncio.to_thread(extract_text_from_file, file.file, file.content_type)
+    if not content.strip():
+        raise HTTPException(status_code=400, detail="Document is empty or unreadable.")
+    return content, file_size
+
+
+def _record_upload(session, filename: str, file_size: int, rag_result: dict) -> str:
+    """Note a stored document on its session and return the document title"""
+    session.uploaded_files.append(filename)
+    session.total_upload_size += file_size
+    session.mark_documents_changed()
+
+    doc_metadata = rag_result.get("document_metadata", {})
+    doc_title = doc_metadata.get("title", filename)
+
+    session.append_message(
+        "system", 
+        f"Document uploaded: '{doc_title}' ({filename}) - {rag_result['chunks_created']} sections processed, ~{rag_result['total_tokens']} tokens analyzed. You can now ask questions about this document by referencing it by name."
+    )
+    return doc_title
+
+
 @router.post("/upload-document")
 async def upload_document(
     file: UploadFile = File(...), 
@@ -161,61 +254,31 @@ async def upload_document(
     current_user: User = Depends(get_current_active_user)  # ADDED: Require authentication
 ):
     try:
-        if chat_session_id:
-            # If uploading to a specific chat, use chat_{id} format
-            session_id = f"chat_{chat_session_id}"
-            logger.info(f"Uploading document to specific chat session: {session_id}")
-        else:
-            # For new/temporary chats, use regular session management
-            session_id = await get_or_create_session_for_request_async(request)
-            logger.info(f"Uploading document to new session: {session_id}")
-        
-        # Add debug logging to track session IDs
-        logger.info(f"Document upload - chat_session_id parameter: {chat_session_id}")
-        logger.info(f"Document upload - final session_id: {session_id}")
+        session_id = await _resolve_upload_session_id(request, chat_session_id)
         logger.info(f"Document upload - user_id: {current_user.id}")
         
-        session = session_manager.get_session(session_id)
-
-        MAX_FILE_SIZE = 10 * 1024 * 1024  # 10MB
-        if file.size and file.size > MAX_FILE_SIZE:
-            raise HTTPException(status_code=413, detail="File size exceeds 10MB limit")
-
-        file_bytes = await file.read()
-        content = extract_text_from_file(file_bytes, file.content_type)
-        if not content.strip():
-            raise HTTPException(status_code=400, detail="Document is empty or unreadable.")
-
-        rag_manager = get_rag_manager()
-        file_type_map = {
-            "application/pdf": "pdf",
-            "application/vnd.openxmlformats-officedocument.wordprocessingml.document": "docx", 
-            "text/plain": "txt"
-        }
-        file_type = file_type_map.get(file.content_type, "unknown")
-
-        # Pass the consistent session_id to RAG manager
-        logger.info(f"Adding document {file.filename} to session {session_id}")
-        rag_result = rag_manager.add_document(
-            content=content,
-            filename=file.filename,
-            session_id=session_id,
-            file_type=file_type
-        )
-
-        if not rag_result["success"]:
-            raise HTTPException(status_code=500, detail=f"Failed to process document: {rag_result.get('error', 'Unknown error')}")
+        # Held in use across the awaits below so the upload is recorded on the resident session
+        with session_manager.session_in_use(session_id) as session:
+            file_type = FILE_TYPE_MAP.get(file.content_type, "unknown")
+            async with _upload_slot():
+                content, file_size = await _extract_upload_text(file)
+
+                # Pass the consistent session_id to RAG manager
+                logger.info(f"Adding document {file.filename} to session {session_id}")
+                rag_manager = get_rag_manager()
+                # Embedding the chunks is blocking work, keep it off the event loop
+                rag_result = await asyncio.to_thread(
+                    rag_manager.add_document,
+                    content=content,
+                    filename=file.filename,
+                    session_id=session_id,
+                    file_type=file_type
+                )
 
-        session.uploaded_files.append(file.filename)
-        session.total_upload_size += len(file_bytes)
+            if not rag_result["success"]:
+                raise HTTPException(status_code=500, detail=f"Failed to process document: {rag_result.get('error', 'Unknown error')}")
 
-        doc_metadata = rag_result.get("document_metadata", {})
-        doc_title = doc_metadata.get("title", file.filename)
-
-        session.append_message(
-            "system", 
-            f"Document uploaded: '{doc_title}' ({file.filename}) - {rag_result['chunks_created']} sections processed, ~{rag_result['total_tokens']} tokens analyzed. You can now ask questions about this document by referencing it by name."
-        )
+            doc_title = _record_upload(session, file.filename, file_size, rag_result)
 
         # Return session info for frontend tracking
         return {
@@ -238,20 +301,95 @@ async def upload_document(
         raise HTTPException(status_code=500, detail=f"Error processing document: {str(e)}")
 
 
+@router.post("/upload-documents")
+async def upload_documents(
+    files: List[UploadFile] = File(...),
+    request: Request = None,
+    chat_session_id: str = Query(None, description="Chat session ID if uploading to specific chat"),
+    current_user: User = Depends(get_current_active_user)
+):
+    """
+    Upload several documents at once. Their chunks are embedded in a single batch;
+    results are returned per file, in upload order.
+    """
+    try:
+        session_id = await _resolve_upload_session_id(request, chat_session_id)
+        with session_manager.session_in_use(session_id) as session:
+            results: List[Optional[dict]] = []
+            documents = []  # (result index, file, file size, document to add)
+            # The whole batch takes one upload slot; its files are parsed one after another
+            async with _upload_slot():
+                for file in files:
+                    try:
+                        content, file_size = await _extract_upload_text(file)
+                    except HTTPException as e:
+                        results.append({"filename": file.filename, "success": False, "error": e.detail})
+                        continue
+                    except ValueError as e:
+                        # Unsupported file type
+                        results.append({"filename": file.filename, "success": False, "error": str(e)})
+                        continue
+                    except Exception as e:
+                        # Unreadable file (e.g. a corrupt PDF or .docx); the rest of the batch goes on
+                        logger.error(f"Error extracting text from {file.filename}: {str(e)}")
+                        results.append({"filename": file.filename, "success": False, "error": f"Could not read document: {str(e)}"})
+                        continue
+                    documents.append((len(results), file, file_size, {
+                        "content": content,
+                        "filename": file.filename,
+                        "file_type": FILE_TYPE_MAP.get(file.content_type, "unknown")
+                    }))
+                    results.append(None)
+
+                if documents:
+                    logger.info(f"Adding {len(documents)} documents to session {session_id}")
+                    rag_manager = get_rag_manager()
+                    rag_results = await asyncio.to_thread(
+                        rag_manager.add_documents, [document for _, _, _, document in documents], session_id
+                    )
+
+                    for (index, file, file_size, document), rag_result in zip(documents, rag_results):
+                        if not rag_result["success"]:
+                            results[index] = {
+                                "filename": file.filename,
+                                "success": False,
+                                "error": f"Failed to process document: {rag_result.get('error', 'Unknown error')}"
+                            }
+                            continue
+
+                        doc_title = _record_upload(session, file.filename, file_size, rag_result)
+                        results[index] = {
+                            "filename": file.filename,
+                            "success": True,
+                            "document_title": doc_title,
+                            "chunks_created": rag_result['chunks_created'],
+                            "total_tokens": rag_result['total_tokens'],
+                            "file_type": document["file_type"]
+                        }
+
+        return {
+            "message": f"{sum(1 for result in results if result['success'])} of {len(results)} documents uploaded and processed successfully.",
+            "results": results,
+            "session_id": session_id,
+            "chat_session_id": chat_session_id
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error processing document uploads: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error processing documents: {str(e)}")
+
+
 @router.post("/search-documents")
 async def search_documents(request: Request, query: str = Body(..., embed=True), persona: str = Body("", embed=True)):
     try:
         session_id = await get_or_create_session_for_request_async(request)  # FIXED: Added await
         rag_manager = get_rag_manager()
 
-        persona_contexts = {
-            "methodologist": "methodology research design analysis",
-            "theorist": "theory theoretical framework conceptual",
-            "pragmatist": "practical application implementation"
-        }
-        persona_context = persona_contexts.get(persona, "")
+        persona_context = SEARCH_PERSONA_CONTEXTS.get(persona, "")
 
-        results = rag_manager.search_documents(
+        results = await rag_manager.asearch_documents_with_context(
             query=query,
             session_id=session_id,
             persona_context=persona_context,
@@ -274,8 +412,8 @@ async def search_documents(request: Request, query: str = Body(..., embed=True),
 async def get_document_stats(request: Request):
     try:
         session_id = await get_or_create_session_for_request_async(request)  # FIXED: Added await
-        rag_manager = get_rag_manager()
-        return rag_manager.get_document_stats(session_id)
+        # Memoized on the session until its documents change
+        return ORJSONResponse(session_manager.get_session(session_id).get_rag_stats())
     except Exception as e:
         logger.error(f"Error getting document stats: {str(e)}")
         return {"total_chunks": 0, "total_documents": 0, "documents": []}
@@ -297,14 +435,16 @@ async def get_document_insights(filename: str, request: Request):
     try:
         session_id = await get_or_create_session_for_request_async(request)  # FIXED: Added await
         rag_manager = get_rag_manager()
-        stats = rag_manager.get_document_stats(session_id)
+        # Per-document statistics come from the session's memoized stats, so the only
+        # vector store round-trip is the sample lookup below
+        stats = session_manager.get_session(session_id).get_rag_stats()
         document_info = next((doc for doc in stats.get("documents", []) if doc["filename"] == filename), None)
 
         if not document_info:
             raise HTTPException(status_code=404, detail=f"Document {filename} not found")
 
         results = rag_manager.collection.get(
-            where={"session_id": session_id, "filename": filename},
+            where={"$and": [{"session_id": session_id}, {"filename": filename}]},
             limit=3,
             include=["documents", "metadatas"]
         )
@@ -344,36 +484,49 @@ async def get_document_insights(filename: str, request: Request):
 @router.get("/export-chat")
 async def export_chat(
     request: Request, 
-    format: str = Query(..., regex="^(txt|pdf|docx)$"),
-    chat_session_id: str = Query(None, description="Optional: specific chat session ID to export"),
+    format: ExportFormat = Query(...),
+    chat_session_id: str = Query(None, description="Optional: specific chat session ID to export, or several comma-separated IDs"),
     current_user: User = Depends(get_current_active_user)
 ):
     """
     Export chat messages. 
-    If chat_session_id is provided, exports that specific stored chat session.
+    If chat_session_id is provided, exports that specific stored chat session
+    (or several, given as comma-separated IDs, one after another in a single file).
     Otherwise, exports the current in-memory session.
     """
     try:
         messages = []
         
         if chat_session_id:
-            # Export specific stored chat session
-            db = get_database()
-            session_data = await db.chat_sessions.find_one({
-                "_id": ObjectId(chat_session_id),
-                "user_id": current_user.id,
-                "is_active": True
-            })
+            # Export specific stored chat session(s), fetched in one round-trip
+            # (normalized through ObjectId so they match the keys of the bulk fetch)
+            chat_session_ids = list(dict.fromkeys(
+                str(to_object_id(session_id.strip())) for session_id in chat_session_id.split(",") if session_id.strip()
+            ))
+            # Only the title and messages are exported; skip the rest of each document
+            sessions_by_id = await fetch_chat_sessions_bulk(
+                chat_session_ids, current_user.id, projection=CHAT_SESSION_PROJECTION
+            )
             
-            if not session_data:
+            if len(sessions_by_id) < len(chat_session_ids):
                 raise HTTPException(
                     status_code=404, 
                     detail="Chat session not found or you don't have permission to access it"
                 )
             
-            raw_messages = session_data.get("messages", [])
-            # Convert stored message format to export-compatible format
-            messages = convert_messages_for_export(raw_messages)
+            for session_id in chat_session_ids:
+                session_data = sessions_by_id[session_id]
+                raw_messages = session_data.get("messages", [])
+                if raw_messages and len(chat_session_ids) > 1:
+                    # Mark where each chat starts in a combined export
+                    messages.append({
+                        'id': session_id,
+                        'role': 'system',
+                        'content': f"Chat: {session_data.get('title', 'Untitled')}",
+                        'timestamp': ''
+                    })
+                # Convert stored message format to export-compatible format
+                messages.extend(convert_messages_for_export(raw_messages))
         else:
             # Export current in-memory session (existing behavior)
             session_id = await get_or_create_session_for_request_async(request)  # FIXED: Added await
@@ -423,7 +576,7 @@ async def export_chat(
 @router.get("/chat-summary")
 async def chat_summary(
     request: Request,
-    format: str = Query("text", regex="^(txt|pdf|docx)$"),
+    format: ExportFormat = Query("txt"),
     chat_session_id: str = Query(None, description="Optional: specific chat session ID to summarize"),
     current_user: User = Depends(get_current_active_user)
 ):
@@ -437,13 +590,14 @@ async def chat_summary(
         messages = []
         
         if chat_session_id:
-            # Summarize specific stored chat session
+            # Summarize specific stored chat session; only its messages are needed.
+            # The _id match is served by the primary key index, so no hint is needed
             db = get_database()
             session_data = await db.chat_sessions.find_one({
-                "_id": ObjectId(chat_session_id),
+                "_id": to_object_id(chat_session_id),
                 "user_id": current_user.id,
                 "is_active": True
-            })
+            }, projection={"messages": 1})
             
             if not session_data:
                 raise HTTPException(
@@ -482,12 +636,9 @@ async def chat_summary(
                 # Parse and render using block formatting
                 blocks = [{"type": "heading", "text": "Chat Summary"}] + parse_summary_to_blocks(summary_text)
 
-                file_stream = generate_pdf_file_from_blocks(blocks)
-                return StreamingResponse(
-                    file_stream,
-                    media_type="application/pdf",
-                    headers={"Content-Disposition": "attachment; filename=chat_summary.pdf"}
-                )
+                # Laying out the PDF is CPU-bound; keep it off the event loop
+                file_stream = await asyncio.to_thread(generate_pdf_file_from_blocks, blocks)
+                return stream_export_file(file_stream, "chat_summary.pdf", "application/pdf")
         except Exception as summary_error:
             logger.error(f"Error generating summary: {str(summary_error)}")
             # Try with simplified content
@@ -507,12 +658,8 @@ async def chat_summary(
                     return prepare_export_response(basic_summary, "docx", filename_prefix="chat_summary")
                 elif format == "pdf":
                     blocks = [{"type": "heading", "text": "Chat Summary"}, {"type": "paragraph", "text": basic_summary}]
-                    file_stream = generate_pdf_file_from_blocks(blocks)
-                    return StreamingResponse(
-                        file_stream,
-                        media_type="application/pdf",
-                        headers={"Content-Disposition": "attachment; filename=chat_summary.pdf"}
-                    )
+                    file_stream = await asyncio.to_thread(generate_pdf_file_from_blocks, blocks)
+                    return stream_export_file(file_stream, "chat_summary.pdf", "application/pdf")
             except Exception as fallback_error:
                 logger.error(f"Fallback summary export also failed: {str(fallback_error)}")
                 raise HTTPException(
@@ -312,5 +312,4 @@ async def _background_canvas_update(user_id: str, request: UpdateCanvasRequest):
         
     except Exception as e:
         logger.error(f"Error in background canvas update for user {user_id}: {e}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
\ No newline at end of file
+        logger.error("Traceback", exc_info=True)
\ No newline at end of file
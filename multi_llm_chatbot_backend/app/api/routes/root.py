@@ -7,7 +7,7 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 @router.get("/")
-def root():
+async def root():
     return {
         "message": "Multi-LLM PhD Advisor Backend is up and running",
         "version": "1.0.0",
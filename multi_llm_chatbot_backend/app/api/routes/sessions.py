@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Request, HTTPException, Depends
 from app.core.session_manager import get_session_manager
-from app.api.utils import get_or_create_session_for_request_async
+from app.api.utils import get_or_create_session_for_request_async, get_or_load_chat_session, to_memory_session_id
 from app.core.auth import get_current_active_user
 from app.models.user import User
 from pydantic import BaseModel
@@ -29,26 +29,18 @@ async def get_context(
     try:
         # Determine which session to get context for with consistent session ID format
         if chat_session_id:
-            # Getting context for a specific chat session - use consistent format
-            session_id = f"chat_{chat_session_id}"
-            logger.info(f"Getting context for specific chat session: {session_id}")
-            
-            # Ensure session is loaded in memory
-            if session_id not in session_manager.sessions:
-                logger.info(f"Chat session {session_id} not in memory, loading from database")
-                loaded_session_id = await get_or_create_session_for_request_async(
-                    request,
-                    chat_session_id=chat_session_id,
-                    user_id=str(current_user.id)
-                )
-                session_id = loaded_session_id
-                logger.info(f"Loaded session ID: {session_id}")
+            # Getting context for a specific chat session - use consistent format,
+            # loading it from the database if it is not in memory
+            session, session_id, was_loaded = await get_or_load_chat_session(
+                request, chat_session_id, str(current_user.id)
+            )
+            logger.info(f"Getting context for specific chat session: {session_id} (loaded: {was_loaded})")
         else:
             # Getting context for current session
             session_id = await get_or_create_session_for_request_async(request)
             logger.info(f"Getting context for current session: {session_id}")
+            session = session_manager.get_session(session_id)
         
-        session = session_manager.get_session(session_id)
         rag_stats = session.get_rag_stats()
         
         #  Enhanced logging for document access debugging
@@ -75,27 +67,28 @@ async def get_context(
             },
             "context_stats": {
                 "message_count": len(session.messages),
-                "user_messages": len([m for m in session.messages if m.get('role') == 'user']),
+                "user_messages": session.role_counts["user"],
                 "uploaded_files": session.uploaded_files,
                 "total_upload_size": session.total_upload_size,
-                "created_at": session.created_at.isoformat(),
-                "last_accessed": session.last_accessed.isoformat()
+                "created_at": session.created_at,
+                "last_accessed": session.last_accessed
             },
             # Add debugging info
             "debug_info": {
                 "session_format": "chat_session" if chat_session_id else "new_session",
-                "session_in_memory": session_id in session_manager.sessions,
+                "session_in_memory": session_manager.contains(session_id),
                 "document_access_working": rag_stats.get("total_documents", 0) > 0
             }
         }
         
         return context_response
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting context for session_id {session_id if 'session_id' in locals() else 'unknown'}: {str(e)}")
         logger.error(f"Chat session ID: {chat_session_id}")
-        import traceback
-        logger.error(f"Full traceback: {traceback.format_exc()}")
+        logger.error("Full traceback", exc_info=True)
         
         return {
             "session_id": session_id if 'session_id' in locals() else None,
@@ -143,9 +136,9 @@ async def reset_session(
         
         elif reset_request.chat_session_id:
             # Reset a specific chat session context
-            session_id = f"chat_{reset_request.chat_session_id}"
+            session_id = to_memory_session_id(reset_request.chat_session_id)
             
-            if session_id in session_manager.sessions:
+            if session_manager.contains(session_id):
                 success = session_manager.reset_session_completely(session_id)
                 message = "Chat session context reset successfully" if success else "Failed to reset chat session context"
             else:
@@ -177,6 +170,8 @@ async def reset_session(
                 "session_id": session_id
             }
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error resetting session: {e}")
         return {"status": "error", "message": f"Failed to reset session: {str(e)}"}
@@ -194,7 +189,7 @@ async def get_session_stats(
     try:
         if chat_session_id:
             # Stats for specific chat session
-            session_id = f"chat_{chat_session_id}"
+            session_id = to_memory_session_id(chat_session_id)
         else:
             # Stats for current session
             session_id = await get_or_create_session_for_request_async(request)
@@ -207,6 +202,8 @@ async def get_session_stats(
         
         return stats
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error getting session stats: {str(e)}")
         return {"error": str(e)}
@@ -225,8 +222,8 @@ async def get_active_sessions(current_user: User = Depends(get_current_active_us
             session_overview[session_id] = {
                 "message_count": len(session.messages),
                 "uploaded_files": len(session.uploaded_files),
-                "created_at": session.created_at.isoformat(),
-                "last_accessed": session.last_accessed.isoformat(),
+                "created_at": session.created_at,
+                "last_accessed": session.last_accessed,
                 "is_chat_session": session_id.startswith("chat_")
             }
         
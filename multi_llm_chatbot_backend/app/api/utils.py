@@ -1,13 +1,123 @@
-from typing import Optional
-from fastapi import Request
-from app.core.session_manager import get_session_manager
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+from app.core.session_manager import ConversationContext, get_session_manager
 from app.core.database import get_database
 from bson import ObjectId
+from bson.errors import InvalidId
+from cachetools import TTLCache
+from functools import lru_cache
+import asyncio
 import logging
+import orjson
+import sys
 
 logger = logging.getLogger(__name__)
 session_manager = get_session_manager()
 
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson. Values orjson can't handle natively
+    (e.g. ObjectId in stored messages) are converted with str().
+    """
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=str, option=orjson.OPT_NON_STR_KEYS)
+
+@lru_cache(maxsize=4096)
+def _parse_object_id(value: str) -> ObjectId:
+    return ObjectId(value)
+
+def to_object_id(chat_session_id: str) -> ObjectId:
+    """
+    Parse a chat session id, rejecting ids that are not valid ObjectIds with a 400.
+    Ids of recently used chats are parsed once and reused.
+    """
+    try:
+        return _parse_object_id(chat_session_id)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid chat_session_id")
+
+def to_memory_session_id(chat_session_id: str) -> str:
+    """
+    Map a chat session id to the id of its in-memory conversation session,
+    rejecting ids that are not valid ObjectIds with a 400. The result is interned,
+    so repeated requests for a chat share one key string with the session manager.
+    """
+    to_object_id(chat_session_id)
+    return sys.intern(f"chat_{chat_session_id}")
+
+# Fields of a chat_sessions document needed to switch to or load a chat
+CHAT_SESSION_PROJECTION = {"title": 1, "messages": 1}
+
+# Recent chat session fetches keyed by (chat_session_id, user_id, message_limit). The
+# value is the fetch task itself, so concurrent callers (e.g. the two lookups in
+# /switch-chat) share a single Mongo round-trip, and switching back and forth between chats is
+# served from memory. Every write to a chat session invalidates its entries.
+_chat_session_cache = TTLCache(maxsize=1024, ttl=30)
+
+async def fetch_chat_session(chat_session_id: str, user_id: str,
+                             message_limit: Optional[int] = None) -> Optional[dict]:
+    """
+    Fetch the title and messages of an active chat session owned by the user,
+    reusing a result fetched within the last few seconds. With message_limit, Mongo
+    returns only the last message_limit messages plus the full count as
+    total_message_count.
+    """
+    key = (chat_session_id, str(user_id), message_limit)
+    fetch = _chat_session_cache.get(key)
+    if fetch is None:
+        db = get_database()
+        projection = CHAT_SESSION_PROJECTION
+        if message_limit:
+            projection = {
+                "title": 1,
+                "messages": {"$slice": -message_limit},
+                "total_message_count": {"$size": {"$ifNull": ["$messages", []]}}
+            }
+        fetch = asyncio.ensure_future(db.chat_sessions.find_one(
+            {
+                "_id": to_object_id(chat_session_id),
+                "user_id": ObjectId(user_id),
+                "is_active": True
+            },
+            projection=projection
+        ))
+        _chat_session_cache[key] = fetch
+    
+    try:
+        chat_session = await asyncio.shield(fetch)
+    except Exception:
+        _chat_session_cache.pop(key, None)
+        raise
+    
+    if chat_session is None:
+        _chat_session_cache.pop(key, None)
+    return chat_session
+
+async def fetch_chat_sessions_bulk(chat_session_ids: List[str], user_id: str,
+                                   projection: Optional[dict] = None) -> Dict[str, dict]:
+    """
+    Fetch several active chat sessions owned by the user in one $in query.
+    Returns the sessions found, keyed by chat session id; ids that don't exist or
+    belong to someone else are simply missing from the result.
+    """
+    db = get_database()
+    object_ids = [to_object_id(chat_session_id) for chat_session_id in chat_session_ids]
+    cursor = db.chat_sessions.find(
+        {
+            "_id": {"$in": object_ids},
+            "user_id": ObjectId(user_id),
+            "is_active": True
+        },
+        projection=projection
+    )
+    return {str(chat_session["_id"]): chat_session for chat_session in await cursor.to_list(length=len(object_ids))}
+
+def invalidate_chat_session_cache(chat_session_id: str):
+    """Forget cached fetches of a chat session after it is modified"""
+    for key in [key for key in list(_chat_session_cache.keys()) if key[0] == chat_session_id]:
+        _chat_session_cache.pop(key, None)
+
 async def load_chat_session_into_context(chat_session_id: str, user_id: str) -> str:
     """
     Load a chat session from MongoDB into memory context - ENHANCED DEBUG VERSION
@@ -21,18 +131,16 @@ async def load_chat_session_into_context(chat_session_id: str, user_id: str) ->
         logger.info(f"For user_id: {user_id}")
         
         # Try to find the session with enhanced debugging
-        chat_session = await db.chat_sessions.find_one({
-            "_id": ObjectId(chat_session_id),
-            "user_id": ObjectId(user_id),
-            "deleted_at": {"$exists": False}
-        })
+        chat_session = await fetch_chat_session(chat_session_id, user_id)
         
         if not chat_session:
             logger.warning(f"Chat session {chat_session_id} not found for user {user_id}")
             
             # Debug: Check if session exists for any user
             try:
-                session_exists = await db.chat_sessions.find_one({"_id": ObjectId(chat_session_id)})
+                session_exists = await db.chat_sessions.find_one(
+                    {"_id": to_object_id(chat_session_id)}, projection={"user_id": 1}
+                )
                 if session_exists:
                     logger.warning(f"Session exists but for different user: {session_exists.get('user_id')}")
                     logger.warning(f"Expected user: {user_id}")
@@ -46,7 +154,8 @@ async def load_chat_session_into_context(chat_session_id: str, user_id: str) ->
             # Debug: List recent sessions for this user
             try:
                 recent_sessions = await db.chat_sessions.find(
-                    {"user_id": ObjectId(user_id), "deleted_at": {"$exists": False}}
+                    {"user_id": ObjectId(user_id), "deleted_at": {"$exists": False}},
+                    projection={"_id": 1}
                 ).limit(5).to_list(5)
                 logger.info(f"Recent sessions for user {user_id}: {[str(s['_id']) for s in recent_sessions]}")
             except Exception as debug_error:
@@ -58,11 +167,10 @@ async def load_chat_session_into_context(chat_session_id: str, user_id: str) ->
         logger.info(f"✅ Message count: {len(chat_session.get('messages', []))}")
         
         # Create consistent memory session ID  
-        memory_session_id = f"chat_{chat_session_id}"
+        memory_session_id = to_memory_session_id(chat_session_id)
         logger.info(f"✅ Creating memory session: {memory_session_id}")
         
-        # Get session manager and create memory session
-        session_manager = get_session_manager()
+        # Create memory session
         memory_session = session_manager.get_session(memory_session_id)
         
         # Clear any existing data
@@ -78,7 +186,7 @@ async def load_chat_session_into_context(chat_session_id: str, user_id: str) ->
                     'content': msg_data.get('content', ''),
                     'timestamp': msg_data.get('timestamp', '')
                 }
-                memory_session.append_message(message['role'], message['content'])
+                memory_session.append_message(message['role'], message['content'], msg_data.get('id'))
                 
                 # Store original message for export
                 if not hasattr(memory_session, 'original_messages'):
@@ -94,8 +202,7 @@ async def load_chat_session_into_context(chat_session_id: str, user_id: str) ->
         
     except Exception as e:
         logger.error(f"Error loading chat session into context: {e}")
-        import traceback
-        logger.error(f"Full traceback: {traceback.format_exc()}")
+        logger.error("Full traceback", exc_info=True)
         return None
 
 async def get_or_create_session_for_request_async(
@@ -127,4 +234,31 @@ async def get_or_create_session_for_request_async(
     # Case 4: Create a truly new session
     new_session_id = session_manager.create_session()
     logger.info(f"Created new session: {new_session_id}")
-    return new_session_id
\ No newline at end of file
+    return new_session_id
+
+async def get_or_load_chat_session(
+    request: Request,
+    chat_session_id: str,
+    user_id: str
+) -> Tuple[ConversationContext, str, bool]:
+    """
+    Get the in-memory session for a stored chat, loading it from MongoDB if it is
+    not resident. Concurrent requests for the same chat share a single load.
+    Returns (session, session_id, was_loaded).
+    """
+    session_id = to_memory_session_id(chat_session_id)
+    was_loaded = False
+    
+    if not session_manager.contains(session_id):
+        # Re-check under the per-session lock; whoever waited on it finds the session loaded
+        async with session_manager.get_load_lock(session_id):
+            if not session_manager.contains(session_id):
+                logger.warning("Chat session %s not in memory, loading now", chat_session_id)
+                session_id = await get_or_create_session_for_request_async(
+                    request,
+                    chat_session_id=chat_session_id,
+                    user_id=user_id
+                )
+                was_loaded = True
+    
+    return session_manager.get_session(session_id), session_id, was_loaded
@@ -6,6 +6,7 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from passlib.context import CryptContext
 from jose import JWTError, jwt
 from bson import ObjectId
+from cachetools import TTLCache
 from app.core.database import get_database
 from app.models.user import User, UserResponse, PasswordReset, EmailVerification
 
@@ -20,6 +21,16 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 30 * 24 * 60  # 30 days
 # Security scheme
 security = HTTPBearer()
 
+# Users resolved from access tokens, keyed by user id, so authenticated requests
+# don't each fetch the user document again. Writes to a user drop its entry.
+_user_cache = TTLCache(maxsize=4096, ttl=60)
+
+def invalidate_cached_user(email: str):
+    """Forget the cached user with this email after the user document is modified"""
+    for user_id, user in list(_user_cache.items()):
+        if user.email == email:
+            _user_cache.pop(user_id, None)
+
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
     return pwd_context.verify(plain_password, hashed_password)
@@ -85,9 +96,12 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
     except JWTError:
         raise credentials_exception
     
-    user = await get_user_by_id(user_id)
+    user = _user_cache.get(user_id)
     if user is None:
-        raise credentials_exception
+        user = await get_user_by_id(user_id)
+        if user is None:
+            raise credentials_exception
+        _user_cache[user_id] = user
     return user
 
 async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
@@ -171,6 +185,7 @@ async def verify_email_code(email: str, verification_code: str) -> bool:
             }
         }
     )
+    invalidate_cached_user(email)
     
     return result.modified_count > 0
 
@@ -238,6 +253,7 @@ async def reset_user_password(email: str, reset_code: str, new_password: str) ->
         {"email": email},
         {"$set": {"hashed_password": hashed_password}}
     )
+    invalidate_cached_user(email)
     
     if result.modified_count > 0:
         # Mark reset token as used
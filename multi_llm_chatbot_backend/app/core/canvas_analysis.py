@@ -109,8 +109,7 @@ class CanvasAnalysisService:
             
         except Exception as e:
             logger.error(f"Error extracting insights from messages: {e}")
-            import traceback
-            logger.error(f"Full traceback: {traceback.format_exc()}")
+            logger.error("Full traceback", exc_info=True)
             return []
     
     async def _extract_insights_from_persona_response(self, response: Dict, message_id: str, chat_session_id: str) -> List[CanvasInsight]:
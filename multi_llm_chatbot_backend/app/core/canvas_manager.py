@@ -200,8 +200,7 @@ class CanvasManager:
                 
             except Exception as e:
                 logger.error(f"Error updating canvas for user {user_id}: {e}")
-                import traceback
-                logger.error(f"Full traceback: {traceback.format_exc()}")
+                logger.error("Full traceback", exc_info=True)
                 raise
             finally:
                 # Clean up lock if no longer needed
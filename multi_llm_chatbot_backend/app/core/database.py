@@ -22,7 +22,11 @@ async def connect_to_mongo():
         # Get database name from environment or use default
         db_name = os.getenv("MONGODB_DATABASE_NAME", "phd_advisor")
         
-        db.client = AsyncIOMotorClient(mongo_url)
+        # Bound the connection pool; Motor checks a connection out only for the
+        # duration of each operation, so this caps concurrent queries, not requests
+        max_pool_size = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+        
+        db.client = AsyncIOMotorClient(mongo_url, maxPoolSize=max_pool_size)
         db.database = db.client[db_name]
         
         # Test connection
@@ -59,10 +63,19 @@ async def create_indexes():
         await db.database.users.create_index("email", unique=True)
         await db.database.users.create_index("created_at")
         
-        # Indexes for chat_sessions collection
-        await db.database.chat_sessions.create_index("user_id")
-        await db.database.chat_sessions.create_index("created_at")
+        # Indexes for chat_sessions collection, one per query shape. Every query filters
+        # on user_id first, so the compound indexes below cover it and the single-field
+        # user_id/created_at indexes are no longer created. Existing deployments keep
+        # theirs until they are dropped as a separate ops step (startup never drops indexes)
+        # Lookups of a single chat (switch-chat, save-message) match on _id and are served
+        # by the unique _id index, so they need no index of their own
+        # Canvas: a user's chats by creation time
         await db.database.chat_sessions.create_index([("user_id", 1), ("created_at", -1)])
+        # Chat list: active sessions of a user, most recently updated first
+        await db.database.chat_sessions.create_index(
+            [("user_id", 1), ("is_active", 1), ("updated_at", -1)],
+            name="user_active_recent"
+        )
         
         # Indexes for email_verifications collection (NEW)
         await db.database.email_verifications.create_index("email")
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+from typing import List, Optional
+
+import numpy as np
+
+from app.core.rag_manager import get_rag_manager
+
+logger = logging.getLogger(__name__)
+
+class TextEmbedder:
+    """
+    Unit-length sentence embeddings for in-process similarity (e.g. persona ranking),
+    computed with the RAG manager's already loaded embedding model
+    """
+
+    def __init__(self):
+        self._model = None
+        self._model_failed = False
+        self._model_lock = asyncio.Lock()
+
+    async def _get_model(self):
+        """
+        Use the RAG manager's embedding model (loading the RAG manager on first use if
+        needed); embeddings stay unavailable if it cannot be loaded
+        """
+        if self._model is not None or self._model_failed:
+            return self._model
+
+        async with self._model_lock:
+            if self._model is None and not self._model_failed:
+                try:
+                    rag_manager = get_rag_manager()
+                    self._model = rag_manager.embedding_model
+                    logger.info(f"Text embedder using embedding model: {rag_manager.embedding_model_name}")
+                except Exception as e:
+                    self._model_failed = True
+                    logger.warning(f"Text embeddings disabled, could not load embedding model: {e}")
+        return self._model
+
+    async def embed(self, text: str) -> Optional[np.ndarray]:
+        """Return a unit-length embedding for text, or None if embeddings are unavailable"""
+        model = await self._get_model()
+        if model is None:
+            return None
+        try:
+            return await asyncio.to_thread(model.encode, text, normalize_embeddings=True)
+        except Exception as e:
+            logger.error(f"Error embedding text: {e}")
+            return None
+
+    async def embed_batch(self, texts: List[str]) -> Optional[np.ndarray]:
+        """Return unit-length embeddings for several texts in one model call, one row per text"""
+        model = await self._get_model()
+        if model is None:
+            return None
+        try:
+            return await asyncio.to_thread(model.encode, texts, normalize_embeddings=True)
+        except Exception as e:
+            logger.error(f"Error embedding texts: {e}")
+            return None
+
+# Global text embedder instance
+_text_embedder = None
+
+def get_text_embedder() -> TextEmbedder:
+    """Get or create the global text embedder instance"""
+    global _text_embedder
+    if _text_embedder is None:
+        _text_embedder = TextEmbedder()
+    return _text_embedder
@@ -1,17 +1,54 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Literal, Optional, Any, Tuple
+from typing_extensions import NotRequired, TypedDict
 from app.models.persona import Persona
 from app.core.session_manager import ConversationContext, get_session_manager
 from app.core.context_manager import get_context_manager
 from app.core.rag_manager import get_rag_manager
+from app.core.embeddings import get_text_embedder
 from app.llm.llm_client import LLMClient
 from app.models.default_personas import is_valid_persona_id
 
+import asyncio
+import hashlib
 import json
 import logging
 import re
 
+import numpy as np
+
 logger = logging.getLogger(__name__)
 
+class PersonaResponse(TypedDict):
+    """Result of chat_with_persona; keys not marked NotRequired are always present"""
+    kind: Literal["ok", "error"]
+    persona_id: str
+    persona_name: str
+    response: str
+    used_documents: bool
+    document_chunks_used: int
+    type: str
+    response_length: NotRequired[str]
+    context_quality: NotRequired[str]
+    session_id: NotRequired[str]
+    persona: NotRequired[Dict[str, Any]]  # Only on "ok" results
+    error: NotRequired[str]  # Only on "error" results
+    available_personas: NotRequired[List[str]]  # Only when the persona id is unknown
+
+# Static suggestions returned with every clarification request
+CLARIFICATION_SUGGESTIONS = (
+    "Ask about research methodology or design",
+    "Get help with theoretical frameworks",
+    "Request guidance on practical next steps",
+    "Upload a document for specific feedback"
+)
+
+# Persona-specific keywords appended to the query for document retrieval
+PERSONA_RETRIEVAL_KEYWORDS = {
+    "methodologist": "methodology research design experimental approach data collection sampling validity reliability statistical analysis quantitative qualitative mixed-methods procedures protocol IRB ethics",
+    "theorist": "theory theoretical framework conceptual model literature review philosophy epistemology ontology paradigm abstract concepts hypothesis proposition postulate axiom",
+    "pragmatist": "practical application implementation action steps next steps recommendation solution strategy timeline concrete advice roadmap execution deliverables milestones"
+}
+
 class ImprovedChatOrchestrator:
     """
     Enhanced orchestrator with document awareness and improved context handling
@@ -19,12 +56,19 @@ class ImprovedChatOrchestrator:
     
     def __init__(self):
         self.personas: Dict[str, Persona] = {}
+        self.persona_names: Dict[str, str] = {}  # persona_id -> display name
         self.session_manager = get_session_manager()
         self.context_manager = get_context_manager()
+        self.embedder = get_text_embedder()
+        # persona_id -> (text that was embedded, its embedding) for persona ranking
+        self._persona_embeddings: Dict[str, Tuple[str, np.ndarray]] = {}
+        # Generations currently running, so identical concurrent requests share one LLM call
+        self._inflight: Dict[str, asyncio.Future] = {}
     
     def register_persona(self, persona: Persona):
         """Register a persona with the orchestrator"""
         self.personas[persona.id] = persona
+        self.persona_names[persona.id] = persona.name
         logger.info(f"Registered persona: {persona.id} ({persona.name})")
     
     def get_persona(self, persona_id: str) -> Optional[Persona]:
@@ -44,35 +88,35 @@ class ImprovedChatOrchestrator:
         """
         try:
             # Get or create session
-            session = self.session_manager.get_session(session_id)
+            with self.session_manager.session_in_use(session_id) as session:
             
-            # Add user message to session
-            session.append_message("user", user_input)
+                # Add user message to session
+                session.append_message("user", user_input)
             
-            # Determine if we need clarification
-            needs_clarification = self._needs_clarification(session, user_input)
+                # Determine if we need clarification
+                needs_clarification = self._needs_clarification(session, user_input)
             
-            if needs_clarification:
-                # Generate clarification question
-                clarification = await self._generate_clarification_question(session)
-                session.append_message("system", f"Clarification request: {clarification}")
+                if needs_clarification:
+                    # Generate clarification question
+                    clarification = await self._generate_clarification_question(session)
+                    session.append_message("system", f"Clarification request: {clarification}")
                 
+                    return {
+                        "status": "clarification_needed",
+                        "message": clarification,
+                        "suggestions": self._get_clarification_suggestions(),
+                        "session_id": session.session_id
+                    }
+            
+                # Generate responses from all personas
+                responses = await self._generate_persona_responses(session, response_length)
+            
                 return {
-                    "status": "clarification_needed",
-                    "message": clarification,
-                    "suggestions": self._get_clarification_suggestions(),
+                    "status": "success",
+                    "responses": responses,
                     "session_id": session.session_id
                 }
             
-            # Generate responses from all personas
-            responses = await self._generate_persona_responses(session, response_length)
-            
-            return {
-                "status": "success",
-                "responses": responses,
-                "session_id": session.session_id
-            }
-            
         except Exception as e:
             logger.error(f"Error in process_message: {str(e)}")
             return {
@@ -87,29 +131,28 @@ class ImprovedChatOrchestrator:
         """
         try:
             # Get session
-            session = self.session_manager.get_session(session_id)
+            with self.session_manager.session_in_use(session_id) as session:
             
-            # Add user message to session
-            session.append_message("user", user_input)
+                # Add user message to session
+                session.append_message("user", user_input)
             
-            # Detect document references in the query
-            document_references = self._extract_document_references_from_query(user_input)
+                # Detect document references in the query
+                document_references = self._extract_document_references_from_query(user_input)
             
-            # Get available documents for this session
-            rag_manager = get_rag_manager()
-            doc_stats = rag_manager.get_document_stats(session_id)
-            available_documents = [doc["filename"] for doc in doc_stats.get("documents", [])]
+                # Get available documents for this session (memoized on the session)
+                doc_stats = session.get_rag_stats()
+                available_documents = [doc["filename"] for doc in doc_stats.get("documents", [])]
             
-            # Generate enhanced persona responses
-            responses = await self._generate_persona_responses(session, response_length)
+                # Generate enhanced persona responses
+                responses = await self._generate_persona_responses(session, response_length)
             
-            return {
-                "status": "success",
-                "responses": responses,
-                "document_references_detected": bool(document_references),
-                "available_documents": available_documents,
-                "session_id": session_id
-            }
+                return {
+                    "status": "success",
+                    "responses": responses,
+                    "document_references_detected": bool(document_references),
+                    "available_documents": available_documents,
+                    "session_id": session_id
+                }
             
         except Exception as e:
             logger.error(f"Error in enhanced message processing: {str(e)}")
@@ -142,8 +185,7 @@ class ImprovedChatOrchestrator:
         Determine if the user input needs clarification
         """
         # If this is not the first message, probably don't need clarification
-        user_messages = [msg for msg in session.messages if msg.get('role') == 'user']
-        if len(user_messages) > 1:
+        if session.role_counts["user"] > 1:
             return False
         
         # Check for vague patterns - FIXED to handle "I am" vs "I'm"
@@ -200,33 +242,29 @@ class ImprovedChatOrchestrator:
         # Return the first option for now (could be made smarter with AI)
         return clarification_options[0]
     
-    def _get_clarification_suggestions(self) -> List[str]:
+    def _get_clarification_suggestions(self) -> Tuple[str, ...]:
         """Get suggestions for clarification"""
-        return [
-            "Ask about research methodology or design",
-            "Get help with theoretical frameworks",
-            "Request guidance on practical next steps",
-            "Upload a document for specific feedback"
-        ]
+        return CLARIFICATION_SUGGESTIONS
     
     async def _generate_persona_responses(self, session: ConversationContext, response_length: str = "medium"):
         """
-        Generate responses from all personas with enhanced RAG integration
+        Generate responses from all personas with enhanced RAG integration.
+        The personas are generated concurrently, so each one sees the conversation
+        up to the user's message; replies are added to the session in persona order.
         """
-        responses = []
+        logger.info(f"Generating responses for {len(self.personas)} personas with enhanced RAG")
         
-        for persona_id, persona in self.personas.items():
-            logger.info(f"Generating response for {persona_id} with enhanced RAG")
-            
-            # Generate persona response with enhanced RAG
-            response_data = await self._generate_single_persona_response(session, persona, response_length)
-            
-            # Add persona response to session context
+        # _generate_single_persona_response handles its own errors and returns a fallback
+        responses = await asyncio.gather(*[
+            self._generate_single_persona_response(session, persona, response_length)
+            for persona in self.personas.values()
+        ])
+        
+        # Add persona responses to session context
+        for persona_id, response_data in zip(self.personas, responses):
             session.append_message(persona_id, response_data["response"])
-            
-            responses.append(response_data)
         
-        return responses
+        return list(responses)
     
     async def _generate_single_persona_response(self, session, persona, response_length: str = "medium"):
         """
@@ -292,42 +330,77 @@ class ImprovedChatOrchestrator:
                 "context_quality": "error"
             }
 
+    async def _generate_single_flight(self, session, persona, user_input: str, response_length: str = "medium"):
+        """
+        Generate a single persona response, letting duplicate concurrent requests
+        for the same session, persona and prompt await the first one's result
+        """
+        prompt_hash = hashlib.sha1(user_input.encode("utf-8")).hexdigest()
+        key = f"{session.session_id}:{persona.id}:{response_length}:{prompt_hash}"
+        
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            logger.info(f"Joining in-flight generation for {persona.id} in session {session.session_id}")
+            return await asyncio.shield(inflight)
+        
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            response_data = await self._generate_single_persona_response(session, persona, response_length)
+            future.set_result(response_data)
+            return response_data
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # Nobody may be waiting on the future; mark the exception as retrieved
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
     async def _retrieve_relevant_documents(self, user_input: str, session_id: str, persona_id: str = "") -> str:
         """
         Enhanced document retrieval with document awareness and better attribution
         """
         try:
             # Add comprehensive logging to track session ID usage
-            logger.info(f"Retrieving documents for session_id: {session_id}")
-            logger.info(f"User input: {user_input[:100]}...")
+            logger.info("Retrieving documents for session_id: %s", session_id)
+            logger.info("User input: %.100s...", user_input)
             
             rag_manager = get_rag_manager()
             
-            # Check what documents are available for this session with detailed logging
-            doc_stats = rag_manager.get_document_stats(session_id)
-            logger.info(f"Available documents for {session_id}: {doc_stats.get('total_documents', 0)} documents, {doc_stats.get('total_chunks', 0)} chunks")
+            # Check what documents are available for this session with detailed logging.
+            # The session memoizes these stats until its documents change, so the vector
+            # store isn't scanned again for every persona on every turn
+            doc_stats = self.session_manager.get_session(session_id).get_rag_stats()
+            logger.info("Available documents for %s: %d documents, %d chunks",
+                        session_id, doc_stats.get('total_documents', 0), doc_stats.get('total_chunks', 0))
             
             # Log document details for debugging
-            if doc_stats.get('documents'):
+            if doc_stats.get('documents') and logger.isEnabledFor(logging.INFO):
                 for doc in doc_stats['documents']:
-                    logger.info(f"  - Document: {doc.get('filename', 'unknown')} ({doc.get('chunks', 0)} chunks)")
+                    logger.info("  - Document: %s (%s chunks)", doc.get('filename', 'unknown'), doc.get('chunks', 0))
             
             # If no documents found and this looks like a chat session, log warning
             if doc_stats.get('total_documents', 0) == 0:
                 if session_id.startswith('chat_'):
                     logger.warning(f"No documents found for chat session {session_id} - this may indicate session ID mismatch during upload")
                     
-                    # Try alternative session ID formats for debugging
-                    alternative_formats = [
-                        session_id.replace('chat_', ''),  # Remove chat_ prefix
-                        session_id,  # Keep as is
-                    ]
-                    
-                    for alt_session_id in alternative_formats:
-                        if alt_session_id != session_id:
-                            alt_stats = rag_manager.get_document_stats(alt_session_id)
-                            if alt_stats.get('total_documents', 0) > 0:
-                                logger.warning(f"Found documents under alternative session ID {alt_session_id}: {alt_stats}")
+                    # Try alternative session ID formats for debugging; each one is a vector
+                    # store scan, so only when debug logging is on
+                    if logger.isEnabledFor(logging.DEBUG):
+                        alternative_formats = [
+                            session_id.replace('chat_', ''),  # Remove chat_ prefix
+                            session_id,  # Keep as is
+                        ]
+                        
+                        for alt_session_id in alternative_formats:
+                            if alt_session_id != session_id:
+                                alt_stats = await rag_manager.aget_document_stats(alt_session_id)
+                                if alt_stats.get('total_documents', 0) > 0:
+                                    logger.warning(f"Found documents under alternative session ID {alt_session_id}: {alt_stats}")
                 else:
                     logger.info(f"No documents found for new session {session_id} - this is normal for new chats")
                 
@@ -335,14 +408,14 @@ class ImprovedChatOrchestrator:
             
             # Extract document hints from user query
             document_hint = self._extract_document_hint_from_query(user_input)
-            logger.info(f"Document hint extracted from query: {document_hint}")
+            logger.info("Document hint extracted from query: %s", document_hint)
             
             # Get persona-specific context for better retrieval
             persona_context = self._get_enhanced_persona_context_keywords(persona_id)
             
             # Search for relevant chunks with document awareness
-            logger.info(f"Searching with persona context: {persona_context[:100]}...")
-            relevant_chunks = rag_manager.search_documents_with_context(
+            logger.info("Searching with persona context: %.100s...", persona_context)
+            relevant_chunks = await rag_manager.asearch_documents_with_context(
                 query=user_input,
                 session_id=session_id,
                 persona_context=persona_context,
@@ -350,33 +423,32 @@ class ImprovedChatOrchestrator:
                 document_hint=document_hint
             )
             
-            logger.info(f"Retrieved {len(relevant_chunks)} chunks for {persona_id}")
+            logger.info("Retrieved %d chunks for %s", len(relevant_chunks), persona_id)
             
             # Log relevance scores for debugging
-            if relevant_chunks:
+            if relevant_chunks and logger.isEnabledFor(logging.INFO):
                 for i, chunk in enumerate(relevant_chunks):
                     relevance = chunk.get("relevance_score", 0)
                     doc_source = chunk.get("document_source", {})
                     filename = doc_source.get("filename", "unknown")
-                    logger.info(f"  Chunk {i+1}: {filename} (relevance: {relevance:.3f})")
+                    logger.info("  Chunk %d: %s (relevance: %.3f)", i + 1, filename, relevance)
             
             if not relevant_chunks:
-                logger.info(f"No relevant document chunks found for query: {user_input[:50]}...")
+                logger.info("No relevant document chunks found for query: %.50s...", user_input)
                 return ""
             
             # Format retrieved content with enhanced attribution
             formatted_context = self._format_document_context_with_attribution(relevant_chunks, persona_id)
             
             # Log final context length
-            logger.info(f"Final document context length: {len(formatted_context)} characters")
+            logger.info("Final document context length: %d characters", len(formatted_context))
             
             return formatted_context
             
         except Exception as e:
             logger.error(f"Error retrieving documents for {persona_id} in session {session_id}: {str(e)}")
             logger.error(f"Error type: {type(e).__name__}")
-            import traceback
-            logger.error(f"Full traceback: {traceback.format_exc()}")
+            logger.error("Full traceback", exc_info=True)
             return ""
 
     def _extract_document_hint_from_query(self, query: str) -> Optional[str]:
@@ -404,12 +476,7 @@ class ImprovedChatOrchestrator:
         """
         Enhanced persona-specific keywords for better document retrieval
         """
-        enhanced_keywords = {
-            "methodologist": "methodology research design experimental approach data collection sampling validity reliability statistical analysis quantitative qualitative mixed-methods procedures protocol IRB ethics",
-            "theorist": "theory theoretical framework conceptual model literature review philosophy epistemology ontology paradigm abstract concepts hypothesis proposition postulate axiom",
-            "pragmatist": "practical application implementation action steps next steps recommendation solution strategy timeline concrete advice roadmap execution deliverables milestones"
-        }
-        return enhanced_keywords.get(persona_id, "")
+        return PERSONA_RETRIEVAL_KEYWORDS.get(persona_id, "")
 
     def _format_document_context_with_attribution(self, chunks: List[Dict], persona_id: str) -> str:
         """
@@ -631,66 +698,124 @@ When analyzing the document context:
         """
         return self._get_enhanced_persona_context_keywords(persona_id)
     
-    async def chat_with_persona(self, user_input: str, persona_id: str, session_id: str, response_length: str = "medium") -> Dict[str, Any]:
+    async def chat_with_personas_batch(self, persona_ids: List[str], user_input: str, session_id: str,
+                                       response_length: str = "medium") -> List[Dict[str, Any]]:
+        """
+        Get replies from several personas to the same user turn.
+
+        The caller has already added the user message to the session, so it is not
+        appended again per persona. The personas are generated concurrently and all see the same conversation.
+        Results are returned in the same order as persona_ids; a persona whose call
+        raised is represented by the exception instance.
+        """
+        return await asyncio.gather(*[
+            self.chat_with_persona(
+                user_input=user_input,
+                persona_id=persona_id,
+                session_id=session_id,
+                response_length=response_length,
+                append_user_message=False
+            )
+            for persona_id in persona_ids
+        ], return_exceptions=True)
+
+    async def stream_personas_batch(self, persona_ids: List[str], user_input: str, session_id: str,
+                                    response_length: str = "medium"):
+        """
+        Same as chat_with_personas_batch, but yields (persona_id, result) pairs in the
+        order the personas finish. Personas still running when the consumer stops
+        iterating are cancelled.
+        """
+        async def run(persona_id: str):
+            try:
+                return persona_id, await self.chat_with_persona(
+                    user_input=user_input,
+                    persona_id=persona_id,
+                    session_id=session_id,
+                    response_length=response_length,
+                    append_user_message=False
+                )
+            except Exception as e:
+                return persona_id, e
+        
+        tasks = [asyncio.create_task(run(persona_id)) for persona_id in persona_ids]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                yield await next_done
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def chat_with_persona(self, user_input: str, persona_id: str, session_id: str, response_length: str = "medium",
+                                append_user_message: bool = True) -> PersonaResponse:
         """
         Chat with a specific persona directly - FIXED for consistent document access
+        Always returns the PersonaResponse keys, with kind "error" when no real reply was produced.
         """
         try:
             persona = self.get_persona(persona_id)
             if not persona:
                 return {
+                    "kind": "error",
                     "error": f"Persona {persona_id} not found",
                     "available_personas": list(self.personas.keys()),
                     "persona_id": persona_id,
-                    "persona_name": "Unknown"
+                    "persona_name": "Unknown",
+                    "response": f"The advisor '{persona_id}' is not available.",
+                    "used_documents": False,
+                    "document_chunks_used": 0,
+                    "type": "error"
                 }
             
-            # Ensure session exists and log session info
-            session = self.session_manager.get_session(session_id)
-            logger.info(f"Chat with {persona_id} using session {session_id}")
+            # Ensure session exists and log session info. It is held in use until the reply is
+            # appended, so it can't be demoted to the warm tier during the LLM call
+            with self.session_manager.session_in_use(session_id) as session:
+                logger.info("Chat with %s using session %s", persona_id, session_id)
             
-            # Add user message to session
-            session.append_message("user", user_input)
+                # Add user message to session
+                if append_user_message:
+                    session.append_message("user", user_input)
             
-            # Use the same session_id for document retrieval
-            logger.info(f"Generating response for {persona_id} with session {session_id}")
+                # Use the same session_id for document retrieval
+                logger.info("Generating response for %s with session %s", persona_id, session_id)
             
-            # Generate response from single persona using consistent session ID
-            response_data = await self._generate_single_persona_response(session, persona, response_length)
+                # Generate response from single persona using consistent session ID
+                response_data = await self._generate_single_flight(session, persona, user_input, response_length)
             
-            # Add response to session
-            session.append_message(persona_id, response_data["response"])
+                # Add response to session
+                session.append_message(persona_id, response_data["response"])
             
-            # Ensure response data includes all necessary fields
-            return {
-                "persona_id": persona_id,
-                "persona_name": persona.name,
-                "response": response_data.get("response", "I'm having trouble generating a response."),
-                "used_documents": response_data.get("used_documents", False),
-                "document_chunks_used": response_data.get("document_chunks_used", 0),
-                "response_length": response_length,
-                "context_quality": response_data.get("context_quality", "unknown"),
-                "session_id": session_id,
-                "type": "single_persona_response",
-                "persona": {
+                # Ensure response data includes all necessary fields
+                return {
+                    "kind": "ok",
                     "persona_id": persona_id,
                     "persona_name": persona.name,
                     "response": response_data.get("response", "I'm having trouble generating a response."),
                     "used_documents": response_data.get("used_documents", False),
-                    "document_chunks_used": response_data.get("document_chunks_used", 0)
+                    "document_chunks_used": response_data.get("document_chunks_used", 0),
+                    "response_length": response_length,
+                    "context_quality": response_data.get("context_quality", "unknown"),
+                    "session_id": session_id,
+                    "type": "single_persona_response",
+                    "persona": {
+                        "persona_id": persona_id,
+                        "persona_name": persona.name,
+                        "response": response_data.get("response", "I'm having trouble generating a response."),
+                        "used_documents": response_data.get("used_documents", False),
+                        "document_chunks_used": response_data.get("document_chunks_used", 0)
+                    }
                 }
-            }
             
         except Exception as e:
             logger.error(f"Error in chat_with_persona for {persona_id}: {str(e)}")
             logger.error(f"Session ID: {session_id}")
-            import traceback
-            logger.error(f"Full traceback: {traceback.format_exc()}")
+            logger.error("Full traceback", exc_info=True)
             
             return {
+                "kind": "error",
                 "error": f"Error processing request: {str(e)}",
                 "persona_id": persona_id,
-                "persona_name": self.personas.get(persona_id, {}).name if persona_id in self.personas else "Unknown",
+                "persona_name": self.persona_names.get(persona_id, "Unknown"),
                 "response": "I encountered an error while processing your request. Please try again.",
                 "used_documents": False,
                 "document_chunks_used": 0,
@@ -701,10 +826,35 @@ When analyzing the document context:
             }
         
 
+    async def _get_persona_embedding_matrix(self) -> Optional[Tuple[List[str], np.ndarray]]:
+        """
+        Embeddings of every registered persona's description, one row per persona id.
+        Personas are embedded once in a single batch and re-embedded only if their prompt changes.
+        """
+        descriptions = {
+            persona_id: f"{persona.name}\n{persona.system_prompt.strip()}"
+            for persona_id, persona in self.personas.items()
+        }
+        stale_ids = [
+            persona_id for persona_id, text in descriptions.items()
+            if self._persona_embeddings.get(persona_id, (None,))[0] != text
+        ]
+        if stale_ids:
+            embeddings = await self.embedder.embed_batch([descriptions[pid] for pid in stale_ids])
+            if embeddings is None:
+                return None
+            for persona_id, embedding in zip(stale_ids, embeddings):
+                self._persona_embeddings[persona_id] = (descriptions[persona_id], embedding)
+        
+        persona_ids = list(descriptions)
+        return persona_ids, np.stack([self._persona_embeddings[pid][1] for pid in persona_ids])
+
     async def get_top_personas(self, session_id: str, k: int = 3) -> List[str]:
         """
-        Use the LLM to rank personas based on current session context.
-        Falls back to default persona order if LLM fails or returns invalid data.
+        Rank personas by similarity between the recent conversation and each persona's
+        description: one embedding for the conversation and one matrix product.
+        Uses the LLM ranking if embeddings are unavailable, and falls back to default
+        persona order if that fails too.
         """
         try:
             session = self.session_manager.get_session(session_id)
@@ -713,14 +863,35 @@ When analyzing the document context:
                 logger.warning("No personas registered.")
                 return []
 
-            # Use the LLM from one of the existing persona objects
-            llm = next(iter(self.personas.values())).llm
-
             # Use recent conversation context (last 5 messages)
             recent_context = "\n".join(
                 msg['content'] for msg in session.get_recent_messages(5)
             )
 
+            persona_matrix = await self._get_persona_embedding_matrix()
+            query_embedding = await self.embedder.embed(recent_context) if persona_matrix else None
+            if query_embedding is None:
+                top_personas = await self._rank_personas_with_llm(recent_context, k)
+            else:
+                persona_ids, embeddings = persona_matrix
+                scores = embeddings @ query_embedding
+                top_personas = [persona_ids[i] for i in np.argsort(-scores)[:k]]
+
+            return top_personas
+
+        except Exception as e:
+            logger.error(f"Error selecting top personas: {e}")
+            return list(self.personas.keys())[:k]
+
+    async def _rank_personas_with_llm(self, recent_context: str, k: int) -> List[str]:
+        """
+        Use the LLM to rank personas based on current session context.
+        Falls back to default persona order if LLM fails or returns invalid data.
+        """
+        try:
+            # Use the LLM from one of the existing persona objects
+            llm = next(iter(self.personas.values())).llm
+
             # Format available persona descriptions
             persona_descriptions = "\n".join([
                 f"- ID: {p.id}\n  Name: {p.name}\n  Prompt: {p.system_prompt.strip()}"
@@ -3,8 +3,9 @@ from chromadb.config import Settings
 from sentence_transformers import SentenceTransformer
 import nltk
 import tiktoken
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import uuid
+import asyncio
 import logging
 import os
 import re
@@ -479,78 +480,116 @@ class EnhancedRAGManager:
         """
         Enhanced document addition with better metadata and document awareness
         """
+        return self.add_documents([
+            {"content": content, "filename": filename, "file_type": file_type}
+        ], session_id)[0]
+    
+    def add_documents(self, documents: List[Dict[str, str]], session_id: str) -> List[Dict[str, Any]]:
+        """
+        Add several documents (dicts with content, filename and file_type) in one
+        ChromaDB call, so all of their chunks are embedded as a single batch.
+        Returns one add_document-style result per document, in the same order.
+        """
+        results: List[Optional[Dict[str, Any]]] = []
+        prepared = []  # (result index, chunk texts, chunk metadatas, chunk ids, doc metadata, total tokens)
+        
+        for document in documents:
+            filename = document["filename"]
+            try:
+                prepared.append((len(results),) + self._prepare_document_chunks(
+                    document["content"], filename, session_id, document.get("file_type", "unknown")
+                ))
+                results.append(None)
+            except ValueError as e:
+                results.append({"success": False, "error": str(e), "filename": filename})
+            except Exception as e:
+                logger.error(f"Error adding document {filename}: {str(e)}")
+                results.append({"success": False, "filename": filename, "error": str(e)})
+        
+        if not prepared:
+            return results
+        
         try:
-            # Preprocess the content
-            cleaned_content = self._preprocess_content(content)
-            if not cleaned_content.strip():
-                return {
-                    "success": False,
-                    "error": "Document content is empty after preprocessing",
-                    "filename": filename
-                }
-            
-            # Extract document metadata
-            doc_metadata = self._extract_document_metadata(cleaned_content, filename, file_type)
-            
-            # Create intelligent chunks with overlap and context preservation
-            chunks = self._create_enhanced_chunks(cleaned_content, filename, doc_metadata)
-            
-            # Prepare data for ChromaDB
-            chunk_texts = []
-            chunk_metadatas = []
-            chunk_ids = []
-            
-            for i, chunk_data in enumerate(chunks):
-                chunk_id = f"{session_id}_{filename}_{i}_{uuid.uuid4().hex[:8]}"
-                
-                # Enhanced metadata with document awareness
-                metadata = {
-                    "session_id": session_id,
-                    "filename": filename,
-                    "file_type": file_type,
-                    "chunk_index": i,
-                    "total_chunks": len(chunks),
-                    "document_section": chunk_data.get("section", "unknown"),
-                    "keywords": chunk_data.get("keywords", ""),
-                    "chunk_type": chunk_data.get("type", "content"),
-                    "document_title": doc_metadata.get("title", filename),
-                    "estimated_tokens": len(chunk_data["text"].split()) * 1.3,
-                    "has_references": "references" in chunk_data["text"].lower(),
-                    "has_methodology": "method" in chunk_data["text"].lower(),
-                    "has_theory": any(word in chunk_data["text"].lower() 
-                                    for word in ["theory", "theoretical", "framework", "concept"])
-                }
-                
-                chunk_texts.append(chunk_data["text"])
-                chunk_metadatas.append(metadata)
-                chunk_ids.append(chunk_id)
-            
             # Add to ChromaDB
             self.collection.add(
-                documents=chunk_texts,
-                metadatas=chunk_metadatas,
-                ids=chunk_ids
+                documents=[text for _, texts, _, _, _, _ in prepared for text in texts],
+                metadatas=[metadata for _, _, metadatas, _, _, _ in prepared for metadata in metadatas],
+                ids=[chunk_id for _, _, _, ids, _, _ in prepared for chunk_id in ids]
             )
+        except Exception as e:
+            for index, *_ in prepared:
+                filename = documents[index]["filename"]
+                logger.error(f"Error adding document {filename}: {str(e)}")
+                results[index] = {"success": False, "filename": filename, "error": str(e)}
+            return results
+        
+        for index, _, chunk_metadatas, _, doc_metadata, total_tokens in prepared:
+            filename = documents[index]["filename"]
             
-            total_tokens = sum(metadata["estimated_tokens"] for metadata in chunk_metadatas)
-            
-            logger.info(f"Successfully added document {filename}: {len(chunks)} chunks, ~{total_tokens:.0f} tokens")
+            logger.info(f"Successfully added document {filename}: {len(chunk_metadatas)} chunks, ~{total_tokens:.0f} tokens")
             
-            return {
+            results[index] = {
                 "success": True,
                 "filename": filename,
-                "chunks_created": len(chunks),
+                "chunks_created": len(chunk_metadatas),
                 "total_tokens": int(total_tokens),
                 "document_metadata": doc_metadata
             }
+        
+        return results
+    
+    def _prepare_document_chunks(self, content: str, filename: str, session_id: str,
+                                 file_type: str) -> Tuple[List[str], List[Dict[str, Any]], List[str], Dict[str, Any], float]:
+        """Chunk a document and build the texts, metadatas and ids to store for it, plus its estimated token total"""
+        # Preprocess the content
+        cleaned_content = self._preprocess_content(content)
+        if not cleaned_content.strip():
+            raise ValueError("Document content is empty after preprocessing")
+        
+        # Extract document metadata
+        doc_metadata = self._extract_document_metadata(cleaned_content, filename, file_type)
+        
+        # Create intelligent chunks with overlap and context preservation
+        chunks = self._create_enhanced_chunks(cleaned_content, filename, doc_metadata)
+        
+        # Prepare data for ChromaDB
+        chunk_texts = []
+        chunk_metadatas = []
+        chunk_ids = []
+        
+        total_tokens = 0.0
+        
+        for i, chunk_data in enumerate(chunks):
+            chunk_id = f"{session_id}_{filename}_{i}_{uuid.uuid4().hex[:8]}"
+            # Walk each chunk's text once for all of the derived fields below
+            text = chunk_data["text"]
+            text_lower = text.lower()
+            estimated_tokens = len(text.split()) * 1.3
+            total_tokens += estimated_tokens
             
-        except Exception as e:
-            logger.error(f"Error adding document {filename}: {str(e)}")
-            return {
-                "success": False,
+            # Enhanced metadata with document awareness
+            metadata = {
+                "session_id": session_id,
                 "filename": filename,
-                "error": str(e)
+                "file_type": file_type,
+                "chunk_index": i,
+                "total_chunks": len(chunks),
+                "document_section": chunk_data.get("section", "unknown"),
+                "keywords": chunk_data.get("keywords", ""),
+                "chunk_type": chunk_data.get("type", "content"),
+                "document_title": doc_metadata.get("title", filename),
+                "estimated_tokens": estimated_tokens,
+                "has_references": "references" in text_lower,
+                "has_methodology": "method" in text_lower,
+                "has_theory": any(word in text_lower 
+                                for word in ["theory", "theoretical", "framework", "concept"])
             }
+            
+            chunk_texts.append(text)
+            chunk_metadatas.append(metadata)
+            chunk_ids.append(chunk_id)
+        
+        return chunk_texts, chunk_metadatas, chunk_ids, doc_metadata, total_tokens
     
     def search_documents_with_context(self, query: str, session_id: str, 
                                     persona_context: str = "", n_results: int = 5,
@@ -610,6 +649,10 @@ class EnhancedRAGManager:
             logger.error(f"Error in enhanced document search: {str(e)}")
             return []
     
+    async def asearch_documents_with_context(self, *args, **kwargs) -> List[Dict[str, Any]]:
+        """search_documents_with_context on a worker thread, so async callers don't block the event loop"""
+        return await asyncio.to_thread(self.search_documents_with_context, *args, **kwargs)
+    
     def _search_with_filters(self, query: str, filters: Dict, n_results: int) -> List[Dict[str, Any]]:
         """Helper method for filtered search"""
         results = self.collection.query(
@@ -928,6 +971,10 @@ class EnhancedRAGManager:
         except Exception as e:
             logger.error(f"Error getting document stats: {str(e)}")
             return {"error": str(e), "total_chunks": 0, "total_documents": 0}
+    
+    async def aget_document_stats(self, session_id: str) -> Dict[str, Any]:
+        """get_document_stats on a worker thread, so async callers don't block the event loop"""
+        return await asyncio.to_thread(self.get_document_stats, session_id)
 
 
 # Global RAG manager instance
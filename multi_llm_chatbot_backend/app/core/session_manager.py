@@ -1,11 +1,24 @@
-from typing import Dict, List, Optional, Any
+from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timedelta
 import uuid
+import pickle
+import zlib
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 import asyncio
+import logging
+import sys
+from itertools import islice
 from threading import Lock
 from app.core.rag_manager import get_rag_manager
 
+logger = logging.getLogger(__name__)
+
+# How many of the newest messages attach_message_id looks through: a turn is the user
+# message, one reply per persona and the odd system note
+ATTACH_ID_WINDOW = 16
+
 @dataclass
 class ConversationContext:
     """Enhanced conversation context for RAG integration"""
@@ -13,6 +26,9 @@ class ConversationContext:
     def __init__(self, session_id: str = None):
         self.session_id = session_id or str(uuid.uuid4())
         self.messages: List[Dict[str, str]] = []
+        self.role_counts: Counter = Counter()  # Running message count per role
+        self._context_chars: int = 0  # Running total of message content length
+        self.messages_by_id: Dict[str, Dict[str, str]] = {}  # Frontend message id -> message
         self.uploaded_files: List[str] = []  # Now just stores filenames, not content
         self.total_upload_size: int = 0  # For tracking purposes only
         self.created_at = datetime.now()
@@ -21,19 +37,47 @@ class ConversationContext:
         # New RAG-related attributes
         self.document_chunks_count: int = 0  # Track total chunks in vector DB
         self.last_retrieval_stats: Dict[str, Any] = {}  # Last RAG retrieval info
+        self._rag_stats: Optional[Dict[str, Any]] = None  # Memoized get_rag_stats() result
+        self.in_use: int = 0  # Callers holding this session across awaits (see SessionManager.session_in_use)
 
-    def append_message(self, role: str, content: str):
+    def append_message(self, role: str, content: str, message_id: Optional[str] = None):
         """Add a message to the conversation history"""
-        self.messages.append({
+        message = {
             "role": role,
             "content": content,
             "timestamp": datetime.now().isoformat()
-        })
+        }
+        if message_id:
+            message["id"] = message_id
+            self.messages_by_id[message_id] = message
+        self.messages.append(message)
+        self.role_counts[role] += 1
+        self._context_chars += len(content)
         self.last_accessed = datetime.now()
 
+    def attach_message_id(self, message_id: str, content: str, role: Optional[str] = None) -> bool:
+        """
+        Index a message that was appended without an id (e.g. a live persona reply)
+        under the id the frontend saved it with, so replies to it resolve in O(1).
+        Only the last turn's messages are searched (newest first), matching role when
+        given so identical replies from different personas can't be confused.
+        """
+        if not message_id or message_id in self.messages_by_id:
+            return False
+        for message in islice(reversed(self.messages), ATTACH_ID_WINDOW):
+            if ("id" not in message and message["content"] == content
+                    and (role is None or message["role"] == role)):
+                message["id"] = message_id
+                self.messages_by_id[message_id] = message
+                return True
+        return False
+
     def clear_messages(self):
         """Clear conversation messages but keep document references"""
         self.messages.clear()
+        self.role_counts.clear()
+        self._context_chars = 0
+        self.messages_by_id.clear()
         self.last_accessed = datetime.now()
 
     def get_messages_by_role(self, role: str) -> List[Dict[str, str]]:
@@ -50,8 +94,10 @@ class ConversationContext:
     
     def get_latest_user_message(self) -> Optional[str]:
         """Get the content of the most recent user message"""
-        user_messages = self.get_user_messages()
-        return user_messages[-1]['content'] if user_messages else None
+        for message in reversed(self.messages):
+            if message.get('role') == 'user':
+                return message['content']
+        return None
 
     def add_uploaded_file(self, filename: str, content: str, file_size: int):
         """
@@ -62,6 +108,7 @@ class ConversationContext:
         """
         self.uploaded_files.append(filename)
         self.total_upload_size += file_size
+        self.mark_documents_changed()
         
         # Add a system message noting the upload (not the full content)
         self.append_message("system", f"Document '{filename}' uploaded and processed into vector database")
@@ -75,14 +122,24 @@ class ConversationContext:
             print(f"Warning: Could not update chunk count: {e}")
 
     def get_context_size(self) -> int:
-        """Calculate conversation context size in characters (excluding vector DB documents)"""
-        return sum(len(msg['content']) for msg in self.messages)
+        """Conversation context size in characters (excluding vector DB documents), kept as a running total"""
+        return self._context_chars
     
+    def mark_documents_changed(self):
+        """Drop state derived from this session's documents after an upload or cleanup"""
+        self._rag_stats = None
+
     def get_rag_stats(self) -> Dict[str, Any]:
-        """Get statistics about documents in vector database for this session"""
+        """
+        Get statistics about documents in vector database for this session.
+        The result is memoized until mark_documents_changed() is called.
+        """
+        if self._rag_stats is not None:
+            return self._rag_stats
         try:
             rag_manager = get_rag_manager()
-            return rag_manager.get_document_stats(self.session_id)
+            self._rag_stats = rag_manager.get_document_stats(self.session_id)
+            return self._rag_stats
         except Exception as e:
             return {"error": str(e), "total_chunks": 0, "total_documents": 0}
 
@@ -92,6 +149,7 @@ class ConversationContext:
         self.clear_messages()
         
         # Clear vector database documents
+        self.mark_documents_changed()
         try:
             rag_manager = get_rag_manager()
             success = rag_manager.delete_session_documents(self.session_id)
@@ -108,50 +166,139 @@ class ConversationContext:
 class SessionManager:
     """Thread-safe session manager for handling multiple user conversations"""
     
-    def __init__(self, session_timeout_hours: int = 24, cleanup_interval_minutes: int = 60):
-        self.sessions: Dict[str, ConversationContext] = {}
+    def __init__(self, session_timeout_hours: int = 24, cleanup_interval_minutes: int = 60,
+                 max_resident_sessions: int = 512, max_warm_sessions: int = 4096):
+        # Ordered by recency of use so the least recently used session is evicted first
+        self.sessions: "OrderedDict[str, ConversationContext]" = OrderedDict()
+        self.max_resident_sessions = max_resident_sessions
+        # Sessions evicted from memory, kept compressed (session_id -> (blob, last_accessed))
+        # so switching back to one doesn't rebuild it from MongoDB
+        self._warm_sessions: "OrderedDict[str, Tuple[bytes, datetime]]" = OrderedDict()
+        self.max_warm_sessions = max_warm_sessions
         self.session_timeout = timedelta(hours=session_timeout_hours)
         self.cleanup_interval = timedelta(minutes=cleanup_interval_minutes)
         self.lock = Lock()
         self.last_cleanup = datetime.now()
+        # Per-session locks so concurrent requests don't load the same chat twice
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+    
+    def get_load_lock(self, session_id: str) -> asyncio.Lock:
+        """Get the asyncio lock that serializes lazy loading of a session"""
+        with self.lock:
+            return self._load_locks.setdefault(session_id, asyncio.Lock())
     
     def create_session(self) -> str:
         """Create a new session and return session ID"""
         session_id = str(uuid.uuid4())
         with self.lock:
             self.sessions[session_id] = ConversationContext(session_id=session_id)
+            self._evict_least_recently_used()
         return session_id
     
-    def get_session(self, session_id: Optional[str] = None) -> ConversationContext:
-        """Get existing session or create new one"""
+    def contains(self, session_id: str) -> bool:
+        """Check whether a session is resident (or warm) without creating it or marking it as used"""
+        with self.lock:
+            return session_id in self.sessions or session_id in self._warm_sessions
+    
+    def peek_session(self, session_id: str) -> Optional[ConversationContext]:
+        """Get a resident session without creating it, promoting it or marking it as used"""
+        with self.lock:
+            return self.sessions.get(session_id)
+    
+    def get_session(self, session_id: Optional[str] = None, pin: bool = False) -> ConversationContext:
+        """Get existing session or create new one (pin: see session_in_use)"""
         if not session_id:
             session_id = self.create_session()
         
         with self.lock:
-            if session_id not in self.sessions:
-                self.sessions[session_id] = ConversationContext(session_id=session_id)
+            session = self._resident_session(session_id)
+            if session is None:
+                # Interned so later lookups with interned ids compare by identity
+                session_id = sys.intern(session_id)
+                session = self.sessions[session_id] = ConversationContext(session_id=session_id)
+            else:
+                self.sessions.move_to_end(session_id)
             
-            session = self.sessions[session_id]
             session.last_accessed = datetime.now()
+            if pin:
+                session.in_use += 1
+            
+            self._evict_least_recently_used()
             
             # Trigger cleanup if needed
             self._cleanup_expired_sessions()
             
             return session
     
+    @contextmanager
+    def session_in_use(self, session_id: Optional[str] = None):
+        """
+        Get a session (like get_session) and keep it resident while the caller holds it.
+        Use this when the session is written to after an await: a session demoted to the
+        warm tier meanwhile would take those writes with it to an orphaned object.
+        """
+        session = self.get_session(session_id, pin=True)
+        try:
+            yield session
+        finally:
+            with self.lock:
+                session.in_use -= 1
+    
     def delete_session(self, session_id: str) -> bool:
         """Delete a specific session"""
         with self.lock:
             if session_id in self.sessions:
-                del self.sessions[session_id]
+                self._drop_session(session_id)
                 return True
-            return False
+            self._load_locks.pop(session_id, None)
+            return self._warm_sessions.pop(session_id, None) is not None
     
     def get_active_session_count(self) -> int:
         """Get number of active sessions"""
         with self.lock:
             return len(self.sessions)
     
+    def _resident_session(self, session_id: str) -> Optional[ConversationContext]:
+        """Get a resident session, promoting it from the warm store if needed (lock held)"""
+        session = self.sessions.get(session_id)
+        if session is None:
+            warm = self._warm_sessions.pop(session_id, None)
+            if warm is not None:
+                session = pickle.loads(zlib.decompress(warm[0]))
+                self.sessions[session.session_id] = session
+                self._evict_least_recently_used()
+        return session
+    
+    def _drop_session(self, session_id: str):
+        """Remove a resident session and the per-session state kept alongside it (lock held)"""
+        del self.sessions[session_id]
+        self._load_locks.pop(session_id, None)
+    
+    def _evict_least_recently_used(self):
+        """
+        Move least recently used sessions beyond max_resident_sessions to the compressed
+        warm store, and drop the oldest warm sessions beyond max_warm_sessions (lock held).
+        Chat messages are stored in MongoDB and documents in the vector store, so a
+        dropped chat session is simply reloaded on its next request. Sessions in use
+        (see session_in_use) are skipped, so the hot tier may briefly run over its limit.
+        """
+        excess = len(self.sessions) - self.max_resident_sessions
+        idle = list(islice(
+            (session_id for session_id, session in self.sessions.items() if not session.in_use),
+            max(excess, 0)
+        ))
+        for session_id in idle:
+            session = self.sessions.pop(session_id)
+            self._load_locks.pop(session_id, None)
+            self._warm_sessions[session_id] = (
+                zlib.compress(pickle.dumps(session, protocol=pickle.HIGHEST_PROTOCOL)),
+                session.last_accessed
+            )
+        
+        while len(self._warm_sessions) > self.max_warm_sessions:
+            session_id, _ = self._warm_sessions.popitem(last=False)
+            logger.debug("Evicted least recently used session %s", session_id)
+    
     def _cleanup_expired_sessions(self):
         """Remove expired sessions (called periodically)"""
         now = datetime.now()
@@ -166,7 +313,15 @@ class SessionManager:
                 expired_sessions.append(session_id)
         
         for session_id in expired_sessions:
-            del self.sessions[session_id]
+            self._drop_session(session_id)
+        
+        expired_warm = [
+            session_id for session_id, (_, last_accessed) in self._warm_sessions.items()
+            if now - last_accessed > self.session_timeout
+        ]
+        for session_id in expired_warm:
+            del self._warm_sessions[session_id]
+        expired_sessions.extend(expired_warm)
         
         self.last_cleanup = now
         
@@ -178,8 +333,8 @@ class SessionManager:
         Completely reset a session - both conversation and vector database documents
         """
         with self.lock:
-            if session_id in self.sessions:
-                session = self.sessions[session_id]
+            session = self._resident_session(session_id)
+            if session is not None:
                 session.clear_all_data()
                 return True
             return False
@@ -187,10 +342,10 @@ class SessionManager:
     def get_session_stats(self, session_id: str) -> Dict[str, Any]:
         """Get comprehensive session statistics including RAG data"""
         with self.lock:
-            if session_id not in self.sessions:
+            session = self._resident_session(session_id)
+            if session is None:
                 return {"error": "Session not found"}
             
-            session = self.sessions[session_id]
             
             # Get basic session stats
             basic_stats = {
@@ -199,8 +354,8 @@ class SessionManager:
                 "uploaded_files": session.uploaded_files,
                 "total_upload_size": session.total_upload_size,
                 "context_size_chars": session.get_context_size(),
-                "created_at": session.created_at.isoformat(),
-                "last_accessed": session.last_accessed.isoformat()
+                "created_at": session.created_at,
+                "last_accessed": session.last_accessed
             }
             
             # Get RAG stats
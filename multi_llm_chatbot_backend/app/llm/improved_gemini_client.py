@@ -1,7 +1,7 @@
 import httpx
 import os
 from typing import List
-from app.llm.llm_client import LLMClient
+from app.llm.llm_client import LLMClient, get_http_client
 from app.core.context_manager import get_context_manager
 import logging
 
@@ -68,35 +68,35 @@ class ImprovedGeminiClient(LLMClient):
                 ]
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/{self.model_name}:generateContent",
-                    json=payload,
-                    headers={"x-goog-api-key": self.api_key}
-                )
-                response.raise_for_status()
-                
-                result = response.json()
-                
-                # Better error handling
-                if "candidates" not in result or not result["candidates"]:
-                    logger.error(f"No candidates in Gemini response: {result}")
-                    return "I apologize, but I'm unable to generate a response right now. Please try again."
-                
-                candidate = result["candidates"][0]
-                
-                if "content" not in candidate or "parts" not in candidate["content"]:
-                    logger.error(f"Invalid candidate structure: {candidate}")
-                    return "I apologize, but I received an unexpected response format. Please try again."
-                
-                text = candidate["content"]["parts"][0].get("text", "").strip()
-                
-                if not text:
-                    logger.warning("Empty response from Gemini")
-                    return "I apologize, but I couldn't generate a meaningful response. Please try rephrasing your question."
-                
-                return self._clean_response(text)
-                
+            client = get_http_client()
+            response = await client.post(
+                f"{self.base_url}/{self.model_name}:generateContent",
+                json=payload,
+                headers={"x-goog-api-key": self.api_key}
+            )
+            response.raise_for_status()
+            
+            result = response.json()
+            
+            # Better error handling
+            if "candidates" not in result or not result["candidates"]:
+                logger.error(f"No candidates in Gemini response: {result}")
+                return "I apologize, but I'm unable to generate a response right now. Please try again."
+            
+            candidate = result["candidates"][0]
+            
+            if "content" not in candidate or "parts" not in candidate["content"]:
+                logger.error(f"Invalid candidate structure: {candidate}")
+                return "I apologize, but I received an unexpected response format. Please try again."
+            
+            text = candidate["content"]["parts"][0].get("text", "").strip()
+            
+            if not text:
+                logger.warning("Empty response from Gemini")
+                return "I apologize, but I couldn't generate a meaningful response. Please try rephrasing your question."
+            
+            return self._clean_response(text)
+            
         except httpx.HTTPStatusError as e:
             logger.error(f"Gemini API HTTP error: {e.response.status_code} - {e.response.text}")
             return "I'm experiencing issues connecting to the AI service. Please try again."
@@ -1,7 +1,7 @@
 import httpx
 from typing import List
 import re
-from app.llm.llm_client import LLMClient
+from app.llm.llm_client import LLMClient, get_http_client
 from app.core.context_manager import get_context_manager
 import logging
 
@@ -45,15 +45,15 @@ class ImprovedOllamaClient(LLMClient):
                 }
             }
             
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(f"{self.base_url}/api/generate", json=payload)
-                response.raise_for_status()
-                
-                result = response.json()
-                text = result.get("response", "").strip()
-                
-                return self._clean_response(text)
-                
+            client = get_http_client()
+            response = await client.post(f"{self.base_url}/api/generate", json=payload)
+            response.raise_for_status()
+            
+            result = response.json()
+            text = result.get("response", "").strip()
+            
+            return self._clean_response(text)
+            
         except httpx.ConnectError:
             logger.error(f"Cannot connect to Ollama at {self.base_url}")
             return "I'm unable to connect to the local AI service. Please ensure Ollama is running."
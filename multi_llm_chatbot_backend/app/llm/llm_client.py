@@ -1,5 +1,27 @@
 from abc import ABC, abstractmethod
-from typing import List
+from typing import List, Optional
+import httpx
+
+# One pooled HTTP client shared by all LLM clients, so connections (and TLS
+# sessions) to the provider are reused across persona calls
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Get or create the shared HTTP client for outbound LLM requests"""
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            timeout=30.0,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=50)
+        )
+    return _http_client
+
+async def close_http_client():
+    """Close the shared HTTP client (called on application shutdown)"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
 
 class LLMClient(ABC):
     """Abstract base class for all LLM clients"""
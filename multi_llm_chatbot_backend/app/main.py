@@ -3,15 +3,17 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
 # Import the new database functions
 from app.core.database import connect_to_mongo, close_mongo_connection
+from app.llm.llm_client import get_http_client, close_http_client
 
 # Import all route modules
 from app.api.routes import router as main_router
+from app.api.utils import ORJSONResponse
 from app.api.routes.auth import router as auth_router
 from app.api.routes.chat_sessions import router as chat_sessions_router
 from app.api.routes.phd_canvas import router as phd_canvas_router
@@ -22,19 +24,24 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
+logger = logging.getLogger(__name__)
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
     await connect_to_mongo()
+    app.state.http = get_http_client()
     yield
     # Shutdown
+    await close_http_client()
     await close_mongo_connection()
 
 app = FastAPI(
     title="Multi-LLM Chatbot Backend",
     version="2.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    # Render every route's JSON with orjson unless it picks its own response class
+    default_response_class=ORJSONResponse
 )
 
 cors_origins = os.getenv("CORS_ORIGINS", "http://localhost:3000").split(",")
@@ -48,6 +55,12 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request: Request, exc: Exception):
+    """Canonical 500 body for errors a route didn't handle (the server logs the traceback)"""
+    logger.error("Unhandled error on %s %s: %s", request.method, request.url.path, exc)
+    return ORJSONResponse(status_code=500, content={"detail": "Internal server error"})
+
 # Include all routers
 app.include_router(main_router)
 app.include_router(auth_router, prefix="/auth", tags=["authentication"])
@@ -55,7 +68,7 @@ app.include_router(chat_sessions_router, prefix="/api", tags=["chat-sessions"])
 app.include_router(phd_canvas_router, prefix="/api", tags=["phd-canvas"])
 
 @app.get("/")
-def root():
+async def root():
     return {
         "message": "Multi-LLM PhD Advisor Backend with Authentication",
         "version": "2.0.0",
@@ -242,6 +242,7 @@ class Persona:
         self.id = id
         self.name = name
         self.system_prompt = system_prompt
+        self.prompt_preview = system_prompt[:100] + "..."  # Shown by /debug/personas
         self.llm = llm
         self.temperature = temperature
 
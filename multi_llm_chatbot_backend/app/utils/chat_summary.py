@@ -6,6 +6,17 @@ from typing import List, Dict
 
 logger = logging.getLogger(__name__)
 
+# Patterns used to tidy and parse every summary, compiled once at import
+_UNBROKEN_BULLET_RE = re.compile(r'(?<!\n)([*•] )')
+_UNBROKEN_NUMBER_RE = re.compile(r'(?<!\n)(\d+\.\s+)')
+_SENTENCE_BEFORE_BULLET_RE = re.compile(r'(?<=[.!?])(?=\s*[*•]\s)')
+_EXTRA_NEWLINES_RE = re.compile(r'\n{3,}')
+_BULLET_LINE_START_RE = re.compile(r'\n([*•] )')
+_RUN_TOGETHER_HEADING_RE = re.compile(r'([.!?])\s*(\*\*[^*]+\*\*)')
+_HEADING_RE = re.compile(r'^\*\*(.+?)\*\*:?$')
+_BULLET_RE = re.compile(r'^[*•-]\s+(.+)')
+_NUMBERED_RE = re.compile(r'^\d+\.\s+(.+)')
+
 async def generate_summary_from_messages(messages: List[dict], llm: LLMClient, max_tokens: int = 800) -> str:
     """
     Summarize the conversation using the given LLM client.
@@ -57,22 +68,22 @@ def _format_summary_text(summary_text: str) -> str:
     # Fix common formatting issues
     
     # Add line breaks before bullet points that don't have them
-    summary_text = re.sub(r'(?<!\n)([*•] )', r'\n\1', summary_text)
+    summary_text = _UNBROKEN_BULLET_RE.sub(r'\n\1', summary_text)
     
     # Add line breaks before numbered lists that don't have them
-    summary_text = re.sub(r'(?<!\n)(\d+\.\s+)', r'\n\1', summary_text)
+    summary_text = _UNBROKEN_NUMBER_RE.sub(r'\n\1', summary_text)
     
     # Add line breaks after periods followed by capital letters (likely new sentences)
-    summary_text = re.sub(r'(?<=[.!?])(?=\s*[*•]\s)', '\n', summary_text)
+    summary_text = _SENTENCE_BEFORE_BULLET_RE.sub('\n', summary_text)
     
     # Clean up multiple consecutive newlines
-    summary_text = re.sub(r'\n{3,}', '\n\n', summary_text)
+    summary_text = _EXTRA_NEWLINES_RE.sub('\n\n', summary_text)
     
     # Ensure bullet points are properly spaced
-    summary_text = re.sub(r'\n([*•] )', r'\n\n\1', summary_text)
+    summary_text = _BULLET_LINE_START_RE.sub(r'\n\n\1', summary_text)
     
     # Fix section headings that might be run together
-    summary_text = re.sub(r'([.!?])\s*(\*\*[^*]+\*\*)', r'\1\n\n\2', summary_text)
+    summary_text = _RUN_TOGETHER_HEADING_RE.sub(r'\1\n\n\2', summary_text)
     
     return summary_text.strip()
 
@@ -98,7 +109,7 @@ def parse_summary_to_blocks(summary_text: str) -> List[Dict]:
             continue
 
         # Match section headings (e.g. **Title:** or **Title**)
-        heading_match = re.match(r'^\*\*(.+?)\*\*:?$', line)
+        heading_match = _HEADING_RE.match(line)
         if heading_match:
             flush_current_block()
             current_block = {"type": "heading", "text": heading_match.group(1).strip()}
@@ -107,7 +118,7 @@ def parse_summary_to_blocks(summary_text: str) -> List[Dict]:
             continue
 
         # Match bullet list items (*, •, or -)
-        bullet_match = re.match(r'^[*•-]\s+(.+)', line)
+        bullet_match = _BULLET_RE.match(line)
         if bullet_match:
             if current_block is None or current_block["type"] != "list" or current_block.get("style") != "bullet":
                 flush_current_block()
@@ -116,7 +127,7 @@ def parse_summary_to_blocks(summary_text: str) -> List[Dict]:
             continue
 
         # Match numbered list items
-        number_match = re.match(r'^\d+\.\s+(.+)', line)
+        number_match = _NUMBERED_RE.match(line)
         if number_match:
             if current_block is None or current_block["type"] != "list" or current_block.get("style") != "numbered":
                 flush_current_block()
@@ -133,12 +144,13 @@ def parse_summary_to_blocks(summary_text: str) -> List[Dict]:
     flush_current_block()
 
     # Debug output to help troubleshoot
-    logger.info(f"[DEBUG] Parsed {len(blocks)} blocks from summary")
-    for i, block in enumerate(blocks):
-        if block["type"] == "list":
-            logger.info(f"Block {i}: {block['type']} ({block['style']}) with {len(block['items'])} items")
-        else:
-            logger.info(f"Block {i}: {block['type']}")
+    logger.info("Parsed %d blocks from summary", len(blocks))
+    if logger.isEnabledFor(logging.DEBUG):
+        for i, block in enumerate(blocks):
+            if block["type"] == "list":
+                logger.debug("Block %d: %s (%s) with %d items", i, block['type'], block['style'], len(block['items']))
+            else:
+                logger.debug("Block %d: %s", i, block['type'])
     
     return blocks
 
@@ -159,15 +171,15 @@ def format_summary_for_text_export(summary_text: str) -> str:
             continue
             
         # Add extra space before section headings
-        if re.match(r'^\*\*(.+?)\*\*:?$', line):
+        if _HEADING_RE.match(line):
             if formatted_lines:  # Don't add space before first heading
                 formatted_lines.append('')
             formatted_lines.append(line)
             formatted_lines.append('')  # Space after heading
         # Add space before bullet points (but group them together)
-        elif re.match(r'^[*•-]\s+', line):
+        elif _BULLET_RE.match(line):
             # Check if previous line was also a bullet point
-            if formatted_lines and not re.match(r'^[*•-]\s+', formatted_lines[-1]):
+            if formatted_lines and not _BULLET_RE.match(formatted_lines[-1]):
                 formatted_lines.append('')  # Space before first bullet in group
             formatted_lines.append(line)
         else:
@@ -1,25 +1,28 @@
 from io import BytesIO
+from typing import BinaryIO, Union
 import PyPDF2
-import tempfile
 import docx2txt
-import os
 
-def extract_text_from_file(file_bytes: bytes, content_type: str) -> str:
+def extract_text_from_file(file: Union[bytes, BinaryIO], content_type: str) -> str:
+    """
+    Extract text from an uploaded document, given either its bytes or a binary
+    file object positioned at the start (e.g. an UploadFile's spooled file)
+    """
+    if isinstance(file, (bytes, bytearray)):
+        file = BytesIO(file)
+
     if content_type == "application/pdf":
-        reader = PyPDF2.PdfReader(BytesIO(file_bytes))
-        return "\n".join(page.extract_text() for page in reader.pages if page.extract_text())
+        reader = PyPDF2.PdfReader(file)
+        # Extract each page's text layer once and skip pages that have none
+        page_texts = (page.extract_text() for page in reader.pages)
+        return "\n".join(text for text in page_texts if text)
 
     elif content_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".docx") as tmp:
-            tmp.write(file_bytes)
-            tmp_path = tmp.name
-        try:
-            return docx2txt.process(tmp_path)
-        finally:
-            os.unlink(tmp_path)  # Clean up temp file
+        # docx2txt unzips from any seekable file object, no temp file needed
+        return docx2txt.process(file)
 
     elif content_type == "text/plain":
-        return file_bytes.decode("utf-8")
+        return file.read().decode("utf-8")
 
     else:
-        raise ValueError("Unsupported file type.")
\ No newline at end of file
+        raise ValueError("Unsupported file type.")
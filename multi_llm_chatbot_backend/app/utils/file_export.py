@@ -11,6 +11,9 @@ from reportlab.lib.units import inch
 from io import BytesIO
 import re
 
+# Size of the chunks export files are sent in
+EXPORT_CHUNK_SIZE = 64 * 1024
+
 def format_messages_for_export(messages: List[dict]) -> str:
     """
     Convert chat messages into a structured exportable string.
@@ -229,14 +232,67 @@ def prepare_export_response(
 ) -> StreamingResponse:
     """
     Prepare a StreamingResponse for export, using the given filename prefix.
+    Text exports of chat messages are encoded as they are sent; PDF and DOCX are
+    container formats whose layout (xref table, zip directory) needs the whole
+    document, so those are built first and then streamed in chunks.
     """
+    if format == "txt" and isinstance(content, list):
+        return StreamingResponse(
+            _iter_txt_export(content),
+            media_type="text/plain",
+            headers={"Content-Disposition": f"attachment; filename={filename_prefix}.txt"}
+        )
+
     stream, filename, media_type = export_chat_as_file(content, format)
 
     # Replace "chat_export" with custom prefix if needed
     final_filename = filename.replace("chat_export", filename_prefix)
 
+    return stream_export_file(stream, final_filename, media_type)
+
+
+def _iter_txt_export(messages: List[dict], chunk_size: int = EXPORT_CHUNK_SIZE):
+    """
+    Yield the text export of chat messages (the same bytes format_messages_for_export
+    would produce, encoded) in chunks of roughly chunk_size, without joining the whole
+    file in memory first
+    """
+    pending = []
+    pending_size = 0
+    for i, m in enumerate(messages):
+        if i:
+            pending.append(b"\n\n")
+        block = f"{m['role']}:\n{m['content'].strip()}".encode("utf-8")
+        pending.append(block)
+        pending_size += len(block)
+        if pending_size >= chunk_size:
+            yield b"".join(pending)
+            pending.clear()
+            pending_size = 0
+    if pending:
+        yield b"".join(pending)
+
+
+def _iter_chunks(buffer: BytesIO, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Yield a buffer's bytes in fixed-size chunks"""
+    view = buffer.getbuffer()
+    try:
+        for start in range(0, len(view), chunk_size):
+            yield bytes(view[start:start + chunk_size])
+    finally:
+        view.release()
+
+
+def stream_export_file(buffer: BytesIO, filename: str, media_type: str) -> StreamingResponse:
+    """
+    Stream a generated export file in fixed-size chunks. Iterating the BytesIO
+    directly would split binary PDF/DOCX data on every newline byte.
+    """
     return StreamingResponse(
-        stream,
+        _iter_chunks(buffer),
         media_type=media_type,
-        headers={"Content-Disposition": f"attachment; filename={final_filename}"}
+        headers={
+            "Content-Disposition": f"attachment; filename={filename}",
+            "Content-Length": str(buffer.getbuffer().nbytes)
+        }
     )
\ No newline at end of file
@@ -397,6 +397,8 @@ const handleNewChat = async (sessionId = null) => {
       const headers = {
         'Content-Type': 'application/json',
         'Authorization': `Bearer ${authToken}`,
+        // Ask for one NDJSON line per advisor so replies show up as they finish
+        'Accept': 'application/x-ndjson',
       };
       
 
@@ -416,35 +418,53 @@ const handleNewChat = async (sessionId = null) => {
         throw new Error(`HTTP error! status: ${response.status}`);
       }
 
-      // Rest of the function remains the same...
-      const data = await response.json();
-      
-      // Process responses...
-      if (data.responses && Array.isArray(data.responses)) {
-        const newResponses = data.responses.map(response => ({
-          id: generateMessageId(),
-          type: 'advisor',
-          persona_id: response.persona_id,
-          content: response.content,
-          timestamp: new Date(),
-          advisorName: response.persona_name || response.persona_id,
-          used_documents: response.used_documents || false,
-          document_chunks_used: response.document_chunks_used || 0
-        }));
-
-        setMessages(prev => [...prev, ...newResponses]);
-        
-        // Save advisor responses to database
-        for (const response of newResponses) {
-          await saveMessageToSession(response);
+      const handleStreamEvent = async (event) => {
+        if (event.type === 'persona_response' && event.response) {
+          const advisorResponse = {
+            id: generateMessageId(),
+            type: 'advisor',
+            persona_id: event.response.persona_id,
+            content: event.response.content,
+            timestamp: new Date(),
+            advisorName: event.response.persona_name || event.response.persona_id,
+            used_documents: event.response.used_documents || false,
+            document_chunks_used: event.response.document_chunks_used || 0
+          };
+
+          setMessages(prev => [...prev, advisorResponse]);
+
+          // Save advisor response to database
+          await saveMessageToSession(advisorResponse);
+        } else if (event.type === 'done' && event.session_debug) {
+          // Log session debug info if available
+          console.log('Session debug info:', event.session_debug);
         }
-        
-        // Log session debug info if available
-        if (data.session_debug) {
-          console.log('Session debug info:', data.session_debug);
+      };
+
+      // Read the response line by line as each advisor finishes
+      const reader = response.body.getReader();
+      const decoder = new TextDecoder();
+      let buffered = '';
+
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+
+        buffered += decoder.decode(value, { stream: true });
+        const lines = buffered.split('\n');
+        buffered = lines.pop();
+
+        for (const line of lines) {
+          if (line.trim()) {
+            await handleStreamEvent(JSON.parse(line));
+          }
         }
       }
 
+      if (buffered.trim()) {
+        await handleStreamEvent(JSON.parse(buffered));
+      }
+
     } catch (error) {
       console.error('Error sending message:', error);
       setMessages(prev => [...prev, {